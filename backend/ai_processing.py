@@ -1,7 +1,74 @@
-import ollama
+import hashlib
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from section_schemas import SECTION_SCHEMAS, estimate_output_tokens, get_consolidated_schema
+from chunking import estimate_tokens, split_into_chunks
+import llm_client
+import metrics
+import revisions
+import rule_extraction
+import section_parsing
+from section_parsing import RetryBudget, SectionParseError
 
 ml_model = 'llama3.1'
 
+# Model routing for the secondary prompts, which only reformat main_result into fixed JSON and can run on
+# a much smaller model. secondary_model applies to all seven sections, section_models overrides single
+# sections, e.g. {'additional_information': 'llama3.1'}; None and missing entries use ml_model.
+secondary_model = None
+section_models = {}
+
+# Pre-extract IBANs, SWIFT codes, tax IDs, dates and amounts with rules, to skip fully covered sections
+# and to correct the LLM's values of those fields
+rule_extraction_enabled = True
+
+# Retry a secondary prompt on ml_model when the smaller model's answer is not a valid JSON object
+fallback_to_main_model = True
+
+# Re-issue a secondary prompt whose answer cannot be repaired into its section's schema, at most
+# section_max_retries times per section and contract_retry_budget times per contract
+section_max_retries = 2
+contract_retry_budget = 4
+
+# A revised contract re-runs only the sections its changes affect, unless more than this share of its
+# text changed; then it is processed from scratch
+revision_max_changed_ratio = 0.3
+
+# Layout of the secondary calls: 'shared_prefix' sends main_result first, in a system message that is the
+# same for all seven sections, so Ollama reuses its KV cache and only prefills each section's instructions;
+# 'instructions_first' sends the instructions followed by main_result in one user message
+SECONDARY_PROMPT_LAYOUTS = ('shared_prefix', 'instructions_first')
+secondary_prompt_layout = 'shared_prefix'
+
+# Prefill the shared prefix with a one-token call before the secondary prompts fan out, so the parallel
+# calls find it cached instead of each prefilling main_result at the same time
+prime_shared_prefix = True
+
+# Maximum number of secondary prompts sent to the model at the same time (1 = sequential)
+secondary_concurrency = 4
+
+# Extraction engines: 'pipeline' runs the main prompt plus seven secondary prompts,
+# 'consolidated' produces the analysis and all seven sections in one schema-constrained call
+EXTRACTION_ENGINES = ('pipeline', 'consolidated')
+extraction_engine = 'pipeline'
+
+# Output caps (num_predict): the main analysis, chunk analyses and their merge get main_output_tokens,
+# each section what its schema needs, but at least min_section_output_tokens. num_ctx is sized by
+# llm_client from the prompt plus this cap.
+main_output_tokens = 2048
+min_section_output_tokens = 512
+# The consolidated call's cap is a realistic total for the analysis and all seven sections, not the sum of
+# their worst cases, which would size num_ctx past the other calls' and reload the model. A truncated
+# answer is repaired, and a section that is still invalid is re-issued on its own.
+consolidated_output_tokens = 4096
+
+# Contracts estimated above this many tokens are analyzed in overlapping chunks (map-reduce)
+# instead of one prompt, so nothing is lost past the end of the model's context window
+chunking_threshold_tokens = 6000
+chunk_tokens = 3000
+chunk_overlap_tokens = 200
+
 # Function to call the main prompt
 def set_main_prompt():
     return """
@@ -45,16 +112,213 @@ Think carefully.
     """
 
 # Function to generate a response based on the provided data
-def generate_ai_response(data, prompt):
-    global ml_model
+# When a progress callback is given, the response is streamed and every token is reported as it arrives
+def generate_ai_response(data, prompt, progress=None, section='main'):
+    global ml_model, main_output_tokens
     complete_prompt = f"{prompt}\n\nContract Data:\n{data}\n"
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': complete_prompt}])
-    return response['message']['content']
+    options = {'num_predict': main_output_tokens}
+    if progress is None:
+        response = llm_client.chat(section=section, model=ml_model, messages=[{'role': 'user', 'content': complete_prompt}], options=options)
+        return response['message']['content']
+
+    tokens = []
+    for chunk in llm_client.chat(section=section, model=ml_model, messages=[{'role': 'user', 'content': complete_prompt}], options=options, stream=True):
+        token = chunk['message']['content']
+        tokens.append(token)
+        progress('main_token', {'token': token})
+    return ''.join(tokens)
+
+# Prompt for one chunk of a contract that is too long to analyze at once
+def set_chunk_prompt(index, count):
+    return f"""{set_main_prompt()}
+The contract is too long to analyze at once. The Contract Data below is only part {index} of {count} of the contract.
+Extract only the information present in this part. If a category has no information in this part, write "Not found in this part" for it.
+    """
+
+# Prompt to merge the chunk analyses into one main result
+def set_merge_prompt():
+    return """
+The Contract Data below contains analyses of consecutive parts of one contract, in order. Parts overlap slightly, so the same clause can appear twice.
+Merge them into a single analysis of the whole contract, using the same sections as the partial analyses:
+1. Contract Information, 2. Billing and Payment Terms, 3. Customer Information, 4. Service or Product Descriptions,
+5. Tax and Legal Requirements, 6. Additional Conditions, 7. Additional Detected Information.
+Combine the information of all parts, remove duplicates, and prefer specific values (amounts, dates, bank details) over "Not found in this part".
+If parts contradict each other, keep both values and say which part each comes from. Do not mention the parts otherwise.
+Important: Keep all extracted information in its original language and format. Do not translate any terms or field names.
+Think carefully.
+    """
+
+# Main analysis of the contract: one prompt, or map-reduce over chunks for contracts above chunking_threshold_tokens
+def generate_main_result(contract_data, concurrency=None, progress=None):
+    global secondary_concurrency, chunking_threshold_tokens, chunk_tokens, chunk_overlap_tokens
+    if estimate_tokens(contract_data) <= chunking_threshold_tokens:
+        return generate_ai_response(contract_data, set_main_prompt(), progress)
+
+    chunks = split_into_chunks(contract_data, chunk_tokens, chunk_overlap_tokens)
+    if concurrency is None:
+        concurrency = secondary_concurrency
+    if progress is not None:
+        progress('chunking', {'chunks': len(chunks)})
+
+    # Map: analyze every chunk with the main prompt
+    partials = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+        futures = {executor.submit(generate_ai_response, chunk, set_chunk_prompt(index + 1, len(chunks)), None, 'chunk'): index for index, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            partials[futures[future]] = future.result()
+            if progress is not None:
+                progress('chunk_completed', {'chunk': futures[future] + 1, 'chunks': len(chunks)})
+
+    # Reduce: merge the partial analyses into one main result
+    return merge_partials(partials, concurrency, progress)
+
+# Analysis tokens one merge call may carry, so that its prompt and output fit the largest context Ollama is given
+def get_merge_input_tokens():
+    global main_output_tokens
+    available = int((llm_client.MAX_NUM_CTX - main_output_tokens) / llm_client.ESTIMATE_MARGIN)
+    return available - llm_client.TEMPLATE_TOKENS_PER_MESSAGE - estimate_tokens(f"{set_merge_prompt()}\n\nContract Data:\n")
+
+# Merge input of consecutive analyses, each given as (first part, last part, analysis)
+def get_merge_input(analyses, count):
+    labelled = []
+    for first, last, analysis in analyses:
+        parts = f"part {first}" if first == last else f"parts {first}-{last}"
+        labelled.append(f"Analysis of {parts} of {count}:\n{analysis}")
+    return "\n\n".join(labelled)
+
+# Merge the partial analyses in a tree: consecutive analyses are merged in groups that fit one merge call,
+# then the results of the groups, until one analysis remains. Only the last merge is streamed to progress.
+def merge_partials(partials, concurrency, progress=None):
+    count = len(partials)
+    analyses = [(index + 1, index + 1, partial) for index, partial in enumerate(partials)]
+    budget = get_merge_input_tokens()
+    while True:
+        # Every group takes at least two analyses, so each round shrinks the list even if one is too large
+        groups = [[]]
+        group_tokens = 0
+        for item in analyses:
+            tokens = estimate_tokens(get_merge_input([item], count))
+            if len(groups[-1]) >= 2 and group_tokens + tokens > budget:
+                groups.append([])
+                group_tokens = 0
+            groups[-1].append(item)
+            group_tokens += tokens
+
+        if len(groups) == 1:
+            return generate_ai_response(get_merge_input(analyses, count), set_merge_prompt(), progress, 'merge')
+
+        def merge_group(group):
+            if len(group) == 1:
+                return group[0][2]
+            return generate_ai_response(get_merge_input(group, count), set_merge_prompt(), None, 'merge')
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(groups)))) as executor:
+            results = list(executor.map(merge_group, groups))
+        analyses = [(group[0][0], group[-1][1], result) for group, result in zip(groups, results)]
+
+# Model that answers a secondary prompt
+def get_section_model(section):
+    global ml_model, secondary_model, section_models
+    return section_models.get(section) or secondary_model or ml_model
+
+# Every model in use, keyed by 'main' and the section names; part of the cache key and warmed up at startup
+def get_model_routing():
+    routing = {"main": ml_model}
+    for section in get_secondary_prompts():
+        routing[section] = get_section_model(section)
+    return routing
+
+# num_predict of a secondary prompt, from the size of its section's schema
+def get_section_output_tokens(section):
+    global min_section_output_tokens
+    return max(min_section_output_tokens, estimate_output_tokens(SECTION_SCHEMAS[section]))
+
+def is_json_object(content):
+    try:
+        return isinstance(json.loads(content), dict)
+    except json.JSONDecodeError:
+        return False
+
+# Shared prefix of the secondary calls, followed by main_result
+def set_secondary_context_prompt():
+    return """
+You are given the analysis of a contract below. Each following request asks for one section of an invoice, extracted from this analysis in JSON format.
+
+Contract analysis:
+"""
+
+def get_secondary_messages(prompt, main_result):
+    global secondary_prompt_layout
+    if secondary_prompt_layout == 'instructions_first':
+        return [{'role': 'user', 'content': f"{prompt}\n{main_result}"}]
+    return [
+        {'role': 'system', 'content': f"{set_secondary_context_prompt()}{main_result}"},
+        {'role': 'user', 'content': prompt}
+    ]
+
+# Prefill the shared prefix once per model that answers several of the sections
+def prime_secondary_prefix(main_result, sections):
+    for model, count in Counter(get_section_model(section) for section in sections).items():
+        if count < 2:
+            continue
+        try:
+            llm_client.chat(section='prefix', model=model, messages=get_secondary_messages('', main_result)[:1], options={'num_predict': 1})
+        except llm_client.LLM_ERRORS as e:
+            # Only an optimization: the sections still prefill the prefix themselves
+            print(f"Priming the shared prefix on {model} failed: {e}")
+
+# Send a secondary prompt to its section's model, falling back to ml_model when the answer does not parse
+# model overrides the section's model, e.g. for the last retry of a section
+def run_secondary_prompt(section, prompt, main_result, model=None):
+    global ml_model, fallback_to_main_model
+    model = model or get_section_model(section)
+    messages = get_secondary_messages(prompt, main_result)
+    options = {'num_predict': get_section_output_tokens(section)}
+    response = llm_client.chat(section=section, model=model, messages=messages, format='json', options=options)
+    content = response['message']['content']
+
+    if model != ml_model and fallback_to_main_model and not is_json_object(content):
+        print(f"{model} returned invalid JSON for {section}, retrying on {ml_model}")
+        metrics.inc('llm_model_fallbacks_total', section=section, model=model)
+        response = llm_client.chat(section=section, model=ml_model, messages=messages, format='json', options=options)
+        content = response['message']['content']
+    return content
+
+# Validate a section's answer against its schema, repairing what can be repaired; when nothing can,
+# re-issue only that section's prompt while both the section's retries and the contract's budget allow
+# The last retry goes to the main model: format='json' keeps a secondary model's answers well-formed, so an
+# answer that is off-schema never reaches the fallback in run_secondary_prompt
+def validate_section(section, content, extract, main_result, budget):
+    global ml_model, fallback_to_main_model, section_max_retries
+    attempts = 0
+    while True:
+        try:
+            data, repaired = section_parsing.parse_section(section, content)
+        except SectionParseError as e:
+            if attempts < section_max_retries and budget.take():
+                attempts += 1
+                model = get_section_model(section)
+                if fallback_to_main_model and model != ml_model and (attempts == section_max_retries or budget.remaining == 0):
+                    model = ml_model
+                    metrics.inc('llm_model_fallbacks_total', section=section, model=get_section_model(section))
+                print(f"Invalid {section} JSON ({e}), re-issuing the prompt on {model} (attempt {attempts})")
+                metrics.inc('section_retries_total', section=section)
+                content = extract(main_result, model=model)
+                continue
+            print(f"Giving up on {section} JSON: {e}")
+            metrics.inc('section_parse_failures_total', section=section)
+            return content
+        if repaired:
+            metrics.inc('section_json_repairs_total', section=section)
+            return json.dumps(data, ensure_ascii=False)
+        return content
+
+def run_validated_extraction(section, extract, main_result, budget):
+    return validate_section(section, extract(main_result), extract, main_result, budget)
 
 # Secondary prompt 1: Invoice Information & Client Data
-def extract_invoice_info(main_result):
-    global ml_model
-    prompt = """
+def set_invoice_info_prompt():
+    return """
     1. Invoice Information & Client Data
 
 Prompt: Based on the extracted invoice information, please provide detailed data for the following fields in JSON format. If the contract specifies **recurring payments** or **installments**, make sure the invoice reflects only the amount for the current billing period, not the total contract value.
@@ -99,13 +363,13 @@ If the contract specifies **installments** or **recurring payments**, ensure tha
 Return Only JSON, and nothing else
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_invoice_info(main_result, model=None):
+    return run_secondary_prompt('invoice_information', set_invoice_info_prompt(), main_result, model)
 
 # Secondary prompt 2: Description or Details of Products/Services
-def extract_service_details(main_result):
-    global ml_model
-    prompt = """
+def set_service_details_prompt():
+    return """
     2. Description or Details of Products/Services
 
 Prompt: Please extract detailed information about the products or services provided, and format the data in JSON in a table-like structure as follows. If the contract involves **installments** or **recurring services**, ensure the **quantity** reflects the current billing period (e.g., one month) and the **total amount** corresponds to the installment amount.
@@ -125,13 +389,13 @@ If the contract specifies **installments** or **recurring services**, make sure
 Return Only JSON, and nothing else
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_service_details(main_result, model=None):
+    return run_secondary_prompt('service_details', set_service_details_prompt(), main_result, model)
 
 # Secondary prompt 3: Calculation Details
-def extract_calculation_details(main_result):
-    global ml_model
-    prompt = """
+def set_calculation_details_prompt():
+    return """
     3. Calculation Details
 
 Prompt:
@@ -158,13 +422,13 @@ If the contract specifies **installments** or **recurring services**, make sure
 Return Only JSON, and nothing else
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_calculation_details(main_result, model=None):
+    return run_secondary_prompt('calculation_details', set_calculation_details_prompt(), main_result, model)
 
 # Secondary prompt 4: Payment Instructions
-def extract_payment_instructions(main_result):
-    global ml_model
-    prompt = """
+def set_payment_instructions_prompt():
+    return """
     4. Payment Instructions
 
 Prompt:
@@ -182,13 +446,13 @@ Please extract the payment instructions from the invoice and format the data in
 }Return Only JSON, and nothing else.
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_payment_instructions(main_result, model=None):
+    return run_secondary_prompt('payment_instructions', set_payment_instructions_prompt(), main_result, model)
 
 # Secondary prompt 5: Special Conditions or Clauses
-def extract_special_conditions(main_result):
-    global ml_model
-    prompt = """
+def set_special_conditions_prompt():
+    return """
     5. Special Conditions or Clauses
 
 Prompt:
@@ -205,13 +469,13 @@ Please extract any special conditions or clauses related to this invoice and for
 Return Only JSON, and nothing else.
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_special_conditions(main_result, model=None):
+    return run_secondary_prompt('special_conditions', set_special_conditions_prompt(), main_result, model)
 
 # Secondary prompt 6: Customer Information
-def extract_customer_info(main_result):
-    global ml_model
-    prompt = """
+def set_customer_info_prompt():
+    return """
     6. Customer Information
 
 Prompt:
@@ -231,13 +495,13 @@ Please extract the detailed customer (Bill To) information from the invoice and
 Return Only JSON, and nothing else.
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
+
+def extract_customer_info(main_result, model=None):
+    return run_secondary_prompt('customer_information', set_customer_info_prompt(), main_result, model)
 
 # Secondary prompt 7: Additional Detected Information
-def extract_additional_info(main_result):
-    global ml_model
-    prompt = """
+def set_additional_info_prompt():
+    return """
     7. Additional Detected Information
 
 Prompt:
@@ -253,37 +517,228 @@ Please review the main extracted data and provide any additional important infor
 Return Only JSON, and nothing else.
 Think carefully.
     """
-    response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}], format='json')
-    return response['message']['content']
 
-# Main function to organize the flow and read contract data from a file
-def process_contract(contract_data):
-    # Set main prompt
-    main_prompt = set_main_prompt()
-    
-    # Step 1: Call main prompt and get response
-    main_result = generate_ai_response(contract_data, main_prompt)
+def extract_additional_info(main_result, model=None):
+    return run_secondary_prompt('additional_information', set_additional_info_prompt(), main_result, model)
+
+# Secondary prompts keyed by the name of their section in the result dictionary
+def get_secondary_extractions():
+    return {
+        "invoice_information": extract_invoice_info,
+        "service_details": extract_service_details,
+        "calculation_details": extract_calculation_details,
+        "payment_instructions": extract_payment_instructions,
+        "special_conditions": extract_special_conditions,
+        "customer_information": extract_customer_info,
+        "additional_information": extract_additional_info
+    }
+
+# Run every secondary prompt on the main result, fanning out over a thread pool when concurrency > 1
+# The optional progress callback is told about each section as soon as it completes
+# sections restricts the run to some of the sections; only those are returned
+def run_secondary_extractions(main_result, concurrency=None, progress=None, rule_fields=None, sections=None):
+    global secondary_concurrency, contract_retry_budget, secondary_prompt_layout, prime_shared_prefix
+    if concurrency is None:
+        concurrency = secondary_concurrency
+    extractions = get_secondary_extractions()
+    if sections is not None:
+        extractions = {section: extract for section, extract in extractions.items() if section in sections}
+    budget = RetryBudget(contract_retry_budget)
+    results = {}
+
+    # Sections the rule pass covers completely need no LLM call
+    if rule_fields is not None:
+        for section in list(extractions):
+            content = rule_extraction.fill_section(section, rule_fields)
+            if content is not None:
+                results[section] = content
+                metrics.inc('llm_calls_skipped_total', section=section)
+                if progress is not None:
+                    progress('section_completed', {'section': section, 'source': 'rules'})
+        pending = {section: extract for section, extract in extractions.items() if section not in results}
+    else:
+        pending = extractions
+
+    if concurrency <= 1 or len(pending) <= 1:
+        for section, extract in pending.items():
+            results[section] = run_validated_extraction(section, extract, main_result, budget)
+            if progress is not None:
+                progress('section_completed', {'section': section})
+        return {section: results[section] for section in extractions}
+
+    if secondary_prompt_layout == 'shared_prefix' and prime_shared_prefix:
+        prime_secondary_prefix(main_result, pending)
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as executor:
+        futures = {executor.submit(run_validated_extraction, section, extract, main_result, budget): section for section, extract in pending.items()}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress is not None:
+                progress('section_completed', {'section': futures[future]})
+
+    # Keep the sections in their usual order
+    return {section: results[section] for section in extractions}
+
+# Replace wrong IBAN, SWIFT, tax ID and currency values in the sections with the rule values they most likely meant
+def apply_rule_fields(result, rule_fields):
+    for section in get_secondary_prompts():
+        result[section], corrections = rule_extraction.correct_section(section, result[section], rule_fields)
+        for field in corrections:
+            metrics.inc('rule_corrections_total', section=section, field=field)
+    result["rule_fields"] = rule_fields
+    return result
+
+# Prompt for the consolidated engine: the main analysis followed by every secondary section
+def set_consolidated_prompt():
+    sections = "\n".join(set_prompt() for set_prompt in get_secondary_prompts().values())
+    keys = ", ".join(f'"{section}"' for section in get_secondary_prompts())
+    return f"""{set_main_prompt()}
+Then, based on your analysis, fill in each of the following sections:
+{sections}
+Return a single JSON object. Put your complete analysis, as plain text, under the key "main_result".
+Put each section under its own key ({keys}), using exactly the JSON structure described for that section.
+Return Only JSON, and nothing else.
+    """
+
+# Secondary prompt builders keyed by the name of their section in the result dictionary
+def get_secondary_prompts():
+    return {
+        "invoice_information": set_invoice_info_prompt,
+        "service_details": set_service_details_prompt,
+        "calculation_details": set_calculation_details_prompt,
+        "payment_instructions": set_payment_instructions_prompt,
+        "special_conditions": set_special_conditions_prompt,
+        "customer_information": set_customer_info_prompt,
+        "additional_information": set_additional_info_prompt
+    }
+
+# Fingerprint of every prompt and schema sent to the model, used to invalidate cached results
+# whenever any of the set_*_prompt() functions changes
+def get_prompt_fingerprint():
+    prompts = [set_main_prompt(), set_consolidated_prompt(), set_chunk_prompt(1, 2), set_merge_prompt()]
+    prompts.append(f"{chunking_threshold_tokens}/{chunk_tokens}/{chunk_overlap_tokens}")
+    prompts += [set_prompt() for set_prompt in get_secondary_prompts().values()]
+    prompts.append(f"{secondary_prompt_layout}/{set_secondary_context_prompt()}")
+    prompts.append(f"output/{main_output_tokens}/{min_section_output_tokens}/{consolidated_output_tokens}")
+    prompts.append(json.dumps(get_consolidated_schema(), sort_keys=True))
+    prompts.append(f"rules/{rule_extraction.RULES_VERSION}/{rule_extraction_enabled}")
+    return hashlib.sha256("\0".join(prompts).encode('utf-8')).hexdigest()
+
+# Single-call engine: one schema-constrained call returns the same dictionary as the pipeline engine
+def process_contract_consolidated(contract_data, progress=None, rule_fields=None):
+    global ml_model, chunking_threshold_tokens, contract_retry_budget, consolidated_output_tokens
+    if estimate_tokens(contract_data) > chunking_threshold_tokens:
+        print("Contract too long for a single consolidated call, using the pipeline engine")
+        return process_contract_pipeline(contract_data, progress=progress, rule_fields=rule_fields)
+
+    complete_prompt = f"{set_consolidated_prompt()}\n\nContract Data:\n{contract_data}\n"
+    options = {'num_predict': consolidated_output_tokens}
+    response = llm_client.chat(section='consolidated', model=ml_model, messages=[{'role': 'user', 'content': complete_prompt}],
+                               format=get_consolidated_schema(), options=options)
+
+    try:
+        data, _ = section_parsing.repair_json(response['message']['content'])
+    except SectionParseError as e:
+        print(f"Error parsing consolidated JSON, falling back to the pipeline engine: {e}")
+        return process_contract_pipeline(contract_data, progress=progress, rule_fields=rule_fields)
+    if not isinstance(data, dict):
+        print("Consolidated JSON is not an object, falling back to the pipeline engine")
+        return process_contract_pipeline(contract_data, progress=progress, rule_fields=rule_fields)
+
+    # Each section is returned as a JSON string, the same as the secondary prompts return it
+    result = {"main_result": data.get("main_result", "")}
+    if progress is not None:
+        progress('main_completed', {'main_result': result["main_result"]})
+    extractions = get_secondary_extractions()
+    budget = RetryBudget(contract_retry_budget)
+    for section in get_secondary_prompts():
+        # A section the single call got wrong is re-issued on its own, from the call's analysis
+        content = json.dumps(data.get(section, {}), ensure_ascii=False)
+        result[section] = validate_section(section, content, extractions[section], result["main_result"], budget)
+        if progress is not None:
+            progress('section_completed', {'section': section})
+    return result
+
+# Pipeline engine: the main prompt followed by the seven secondary prompts
+def process_contract_pipeline(contract_data, concurrency=None, progress=None, rule_fields=None):
+    # Step 1: Call main prompt and get response (chunked for long contracts)
+    main_result = generate_main_result(contract_data, concurrency, progress)
+    if progress is not None:
+        progress('main_completed', {'main_result': main_result})
     
     # Step 2: Process main result through each secondary prompt
-    invoice_info = extract_invoice_info(main_result)
-    service_details = extract_service_details(main_result)
-    calculation_details = extract_calculation_details(main_result)
-    payment_instructions = extract_payment_instructions(main_result)
-    special_conditions = extract_special_conditions(main_result)
-    customer_info = extract_customer_info(main_result)
-    additional_info = extract_additional_info(main_result)
+    sections = run_secondary_extractions(main_result, concurrency, progress, rule_fields)
     
     # Combine the results into a dictionary
-    result = {
-        "main_result": main_result,
-        "invoice_information": invoice_info,
-        "service_details": service_details,
-        "calculation_details": calculation_details,
-        "payment_instructions": payment_instructions,
-        "special_conditions": special_conditions,
-        "customer_information": customer_info,
-        "additional_information": additional_info
-    }
+    result = {"main_result": main_result}
+    result.update(sections)
     
     # Return the result as a JSON string
     return result
+
+# Revision-aware processing: diff a revised contract against the previous version, re-run only the
+# sections its changed clauses affect and reuse the previous result for the rest
+def process_contract_revision(contract_data, previous_data, previous_result, concurrency=None, engine=None, progress=None):
+    global revision_max_changed_ratio
+    changes = revisions.diff_texts(previous_data, contract_data)
+    ratio = revisions.changed_ratio(changes, contract_data)
+    if ratio > revision_max_changed_ratio:
+        print(f"{ratio:.0%} of the contract changed, processing the revision from scratch")
+        return process_contract(contract_data, concurrency, engine, progress)
+
+    sections = revisions.affected_sections(changes)
+    if progress is not None:
+        progress('revision_diff', {'changes': len(changes), 'changed_ratio': round(ratio, 3), 'sections': sorted(sections)})
+
+    rule_fields = None
+    if rule_extraction_enabled:
+        rule_fields = rule_extraction.pre_extract(contract_data)
+        if progress is not None:
+            progress('rules_extracted', {field: len(values) for field, values in rule_fields.items()})
+
+    # The previous analysis plus the changed clauses stands in for a new main analysis
+    main_result = previous_result["main_result"]
+    if changes:
+        main_result += "\n" + revisions.describe_changes(changes)
+    if progress is not None:
+        progress('main_completed', {'main_result': main_result})
+
+    rerun = run_secondary_extractions(main_result, concurrency, progress, rule_fields, sections)
+    result = {"main_result": main_result}
+    for section in get_secondary_prompts():
+        if section in rerun:
+            result[section] = rerun[section]
+            metrics.inc('revision_sections_total', outcome='rerun')
+        else:
+            result[section] = previous_result[section]
+            metrics.inc('revision_sections_total', outcome='reused')
+            if progress is not None:
+                progress('section_completed', {'section': section, 'source': 'previous'})
+
+    if rule_fields is not None:
+        apply_rule_fields(result, rule_fields)
+    return result
+
+# Main function to organize the flow and read contract data from a file
+# progress(event, data) is an optional callback reporting each stage as it happens
+def process_contract(contract_data, concurrency=None, engine=None, progress=None):
+    global extraction_engine
+    if engine is None:
+        engine = extraction_engine
+    if engine not in EXTRACTION_ENGINES:
+        raise ValueError(f"Unknown extraction engine: {engine}")
+
+    # Rule-based pre-extraction takes milliseconds and runs on the raw text before any LLM call
+    rule_fields = None
+    if rule_extraction_enabled:
+        rule_fields = rule_extraction.pre_extract(contract_data)
+        if progress is not None:
+            progress('rules_extracted', {field: len(values) for field, values in rule_fields.items()})
+
+    if engine == 'consolidated':
+        result = process_contract_consolidated(contract_data, progress, rule_fields)
+    else:
+        result = process_contract_pipeline(contract_data, concurrency, progress, rule_fields)
+
+    if rule_fields is not None:
+        apply_rule_fields(result, rule_fields)
+    return result
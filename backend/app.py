@@ -1,24 +1,31 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from PyPDF2 import PdfReader
-import docx 
-from PIL import Image
-import pytesseract
-import openpyxl
-import xlrd
-from reportlab.lib.units import mm
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-import textwrap
+from werkzeug.utils import secure_filename
 import json
 import os
 import time
-from ai_processing import process_contract
-from pdf_generator import generate_invoice_from_text
+import uuid
+import ai_processing
+import llm_client
+import metrics
+from ai_processing import process_contract, get_prompt_fingerprint, EXTRACTION_ENGINES, extraction_engine
+from pdf_generator import render_invoice_from_text, make_invoice_filename
+from invoice_store import get_invoice_store
+from retention import FolderRetention, RetentionDaemon, leases
+from result_cache import ResultCache, make_cache_key
+import extractors
+from jobs import JobQueue, QueueFullError, PRIORITIES, DONE, FAILED, CANCELLED
+from ingest import SpooledRequest, sniff_format, sniff_file, detach_upload, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES
+from batch import BatchFolder, BatchTooLargeError, run_batch, build_archive, BATCH_LLM_WORKERS, CONVERTED
 
 app = Flask(__name__)
 CORS(app)
 
+# Uploads are spooled in memory up to a threshold instead of always going through a temporary file, and
+# requests over the size limit are refused before their body is read
+app.request_class = SpooledRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
 # Folder to save uploaded files, text files, and generated invoices
 UPLOAD_FOLDER = './uploads'
 TEXT_FOLDER = './text_files'
@@ -29,51 +36,188 @@ for folder in [UPLOAD_FOLDER, TEXT_FOLDER, INVOICE_FOLDER]:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
-# Helper function to extract text from a PDF file
-def extract_text_from_pdf(file_path):
-    reader = PdfReader(file_path)
-    text = ''
-    for page in reader.pages:
-        text += page.extract_text()  # Extract text from each page
-    return text
+# Retention quotas of the working folders, oldest entries are deleted first; None disables a limit
+retention_daemon = RetentionDaemon([
+    FolderRetention('uploads', UPLOAD_FOLDER, max_age_seconds=24 * 3600, max_bytes=2 * 1024 * 1024 * 1024),
+    FolderRetention('text_files', TEXT_FOLDER, max_age_seconds=7 * 24 * 3600, max_bytes=512 * 1024 * 1024),
+    FolderRetention('invoices', INVOICE_FOLDER, max_age_seconds=30 * 24 * 3600, max_bytes=1024 * 1024 * 1024),
+])
 
-# Helper function to extract text from a Word (.docx) file
-def extract_text_from_word(file_path):
-    doc = docx.Document(file_path)
-    text = ''
-    for para in doc.paragraphs:
-        text += para.text + '\n'
-    return text
+# Cache of process_contract results, keyed by extracted text, model, engine and prompt fingerprint
+PROMPT_FINGERPRINT = get_prompt_fingerprint()
+result_cache = ResultCache()
 
-# Helper function to extract text from an image (JPG, PNG) file using OCR
-def extract_text_from_image(file_path):
-    image = Image.open(file_path)
-    text = pytesseract.image_to_string(image)
-    return text
+# Generated invoices and batch archives: the invoices folder, process memory or a blob store
+invoice_store = get_invoice_store()
 
-# Helper function to extract text from an Excel (.xlsx) file
-def extract_text_from_excel(file_path):
-    workbook = openpyxl.load_workbook(file_path)
-    text = ''
-    for sheet in workbook.sheetnames:
-        worksheet = workbook[sheet]
-        for row in worksheet.iter_rows(values_only=True):
-            text += '\t'.join([str(cell) if cell is not None else '' for cell in row]) + '\n'
-    return text
+# Background worker pool for contract conversions
+job_queue = JobQueue()
+
+
+def result_cache_lookups():
+    # One get_stats call per scrape: it lists the cache folder
+    stats = result_cache.get_stats()
+    return [({'outcome': outcome}, stats[outcome]) for outcome in ('memory_hits', 'disk_hits', 'misses')]
+
+
+# Cache and job queue state, reported on every /metrics scrape
+metrics.register_gauge('result_cache_lookups', 'Result cache lookups since startup, by outcome.', result_cache_lookups)
+metrics.register_gauge('conversion_jobs', 'Conversion jobs currently known to the queue, by state.', lambda: [
+    ({'state': state}, count) for state, count in job_queue.count_by_state().items()
+])
+metrics.register_gauge('conversion_jobs_queued', 'Conversion jobs waiting for a worker, by priority.', lambda: [
+    ({'priority': priority}, count) for priority, count in job_queue.get_stats()['queued'].items()
+])
 
-# Helper function to extract text from an Excel (.xls) file
-def extract_text_from_xls(file_path):
-    workbook = xlrd.open_workbook(file_path)
-    text = ''
-    for sheet_index in range(workbook.nsheets):
-        sheet = workbook.sheet_by_index(sheet_index)
-        for row_idx in range(sheet.nrows):
-            row_values = sheet.row_values(row_idx)
-            text += '\t'.join([str(cell) for cell in row_values]) + '\n'
+# Background work belongs to the serving process only. Run as a script (python app.py), this module is
+# imported again as __mp_main__ by the worker processes of the PDF and OCR pools, which must not start it.
+if __name__ != '__mp_main__':
+    retention_daemon.start()
+    # Drop results produced by older versions of the prompts
+    result_cache.invalidate(PROMPT_FINGERPRINT)
+    job_queue.start()
+    # Load the models into Ollama now instead of on the first upload, and keep them resident
+    llm_client.start(sorted(set(ai_processing.get_model_routing().values())))
+
+SUPPORTED_EXTENSIONS = list(extractors.EXTENSION_TYPES)
+
+# Extract text from an upload (a path or a binary file object) based on its file type
+# The extractor comes from the registry, which imports its parsing library on first use
+def extract_text(source, file_ext):
+    mime_type = extractors.mime_type_of(file_ext)
+    if mime_type is None:
+        raise ValueError(f'Unsupported file type: {file_ext}')
+    return extractors.extract_text(source, mime_type)
+
+# Extract the text of an upload and keep a copy in TEXT_FOLDER, named after text_name (default: the upload's stem)
+# file_ext is the format sniffed from the content; it is sniffed here when not given
+def extract_upload_text(source, filename, progress, file_ext=None, text_name=None):
+    if file_ext is None:
+        file_ext = sniff_file(source) if isinstance(source, str) else sniff_format(source)
+        if file_ext is None:
+            raise ValueError('Unrecognized file format')
+    with metrics.span('text_extraction', file_type=file_ext):
+        text = extract_text(source, file_ext)
+    progress('text_extracted', {'characters': len(text)})
+
+    # Save the extracted text into a .txt file
+    text_filename = (text_name or os.path.splitext(filename)[0]) + '.txt'
+    text_filepath = os.path.join(TEXT_FOLDER, text_filename)
+    with open(text_filepath, 'w') as text_file:
+        text_file.write(text)
     return text
 
+# Stored text of an earlier upload, or None when it is gone (never uploaded, or deleted by retention)
+def read_stored_text(filename):
+    text_filepath = os.path.join(TEXT_FOLDER, os.path.splitext(filename)[0] + '.txt')
+    with leases.hold(text_filepath):
+        try:
+            with open(text_filepath, 'r') as text_file:
+                return text_file.read()
+        except FileNotFoundError:
+            return None
+
+# Turn extracted contract text into an invoice PDF and return its download URL
+# previous_text is the text of the version this contract revises, if any
+def invoice_from_text(text, filename, engine, progress, previous_text=None):
+    # Process the extracted text with the AI model, unless the same contract was already processed
+    routing = json.dumps(ai_processing.get_model_routing(), sort_keys=True)
+    cache_key = make_cache_key(text, routing, engine, PROMPT_FINGERPRINT)
+    processed_text = result_cache.get(cache_key)
+    if processed_text is None:
+        # A revision of an already processed contract only re-runs the sections its changes affect
+        previous_result = None
+        if previous_text is not None:
+            previous_result = result_cache.get(make_cache_key(previous_text, routing, engine, PROMPT_FINGERPRINT))
+        if previous_result is not None:
+            processed_text = ai_processing.process_contract_revision(text, previous_text, previous_result, engine=engine, progress=progress)
+        else:
+            processed_text = process_contract(text, engine=engine, progress=progress)
+        result_cache.put(cache_key, processed_text, PROMPT_FINGERPRINT)
+    else:
+        progress('cache_hit', {'main_result': processed_text['main_result']})
+    
+    # Generate a unique invoice based on the uploaded file, rendered in memory
+    with metrics.span('pdf_render'):
+        invoice_data = render_invoice_from_text(processed_text)
+    if invoice_data is None:
+        raise ValueError('Could not generate an invoice from the AI response')
+    invoice_filename = make_invoice_filename(os.path.splitext(filename)[0])
+    with metrics.span('invoice_store'):
+        invoice_store.put(invoice_filename, invoice_data)
+
+    # URL to download the generated invoice
+    return f'/api/download-invoice/{invoice_filename}'
+
+# Convert a saved upload into an invoice; runs in the job worker pool
+# progress(event, data) reports each stage to clients following the job's event stream
+def convert_upload(source, filename, engine, progress=None, file_ext=None, previous_text=None):
+    if progress is None:
+        progress = lambda event, data=None: None
+
+    text = extract_upload_text(source, filename, progress, file_ext)
+    invoice_url = invoice_from_text(text, filename, engine, progress, previous_text)
+    progress('invoice_ready', {'invoiceUrl': invoice_url})
+    return {'invoiceUrl': invoice_url}
+
+# Convert every file of a batch upload and bundle the invoices into one ZIP; runs in the job worker pool
+# llm_workers is the number of files converted at once, one job worker slot each
+def convert_batch(batch_id, files, skipped, engine, llm_workers=None, progress=None):
+    if progress is None:
+        progress = lambda event, data=None: None
+
+    def convert_file(entry, extraction_slot, llm_slot):
+        # Stage events of each file are tagged with its name; streamed tokens would drown the batch progress
+        def file_progress(event, data=None):
+            if event != 'main_token':
+                progress(event, dict(data or {}, filename=entry['filename']))
+
+        # Texts of batch files are kept under the batch's name, so they never replace the text of a single
+        # upload of the same name that a later revisionOf would diff against
+        text_name = f"batch_{batch_id}_{os.path.splitext(entry['filename'])[0]}"
+        with extraction_slot:
+            text = extract_upload_text(entry['path'], entry['filename'], file_progress, text_name=text_name)
+        with llm_slot:
+            invoice_url = invoice_from_text(text, entry['filename'], engine, file_progress)
+        return {'invoice': os.path.basename(invoice_url), 'invoiceUrl': invoice_url}
+
+    progress('batch_started', {'files': len(files), 'skipped': len(skipped)})
+    manifest = run_batch(files, convert_file, llm_workers=llm_workers, progress=progress) + skipped
+    for entry in manifest:
+        metrics.inc('batch_files_total', outcome=entry['status'])
+
+    archive_name = f'invoices_batch_{batch_id}.zip'
+    invoice_store.put(archive_name, build_archive(manifest, invoice_store))
+    return {
+        'batchId': batch_id,
+        'converted': sum(1 for entry in manifest if entry['status'] == CONVERTED),
+        'total': len(manifest),
+        'manifest': manifest,
+        'archiveUrl': f'/api/download-batch/{archive_name}'
+    }
+
+# Refuse a submission the job queue is too busy for with 429 and the seconds to wait before retrying
+def queue_full(e):
+    response = jsonify({'error': f'Too many pending conversions: {e}', 'retryAfter': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
+# Priority of a submission, from the query string so it is known before the upload is read
+def get_priority(default):
+    priority = request.args.get('priority', default)
+    return priority if priority in PRIORITIES else None
+
 @app.route('/api/convert-contract', methods=['POST'])
 def convert_contract():
+    priority = get_priority('normal')
+    if priority is None:
+        return jsonify({'error': 'Unsupported priority'}), 400
+    # When saturated, answer before reading the upload at all
+    try:
+        job_queue.check_admission(priority)
+    except QueueFullError as e:
+        return queue_full(e)
+
     if 'contract' not in request.files:
         return jsonify({'error': 'No file part'}), 400
 
@@ -81,60 +225,233 @@ def convert_contract():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
-    # Save the uploaded file
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    filepath = os.path.join(UPLOAD_FOLDER, file.filename)
-    file.save(filepath)
-
-    # Extract text based on file type
-    text = ""
-    if file_ext == '.pdf':
-        text = extract_text_from_pdf(filepath)
-    elif file_ext == '.docx':
-        text = extract_text_from_word(filepath)
-    elif file_ext in ['.jpg', '.jpeg', '.png']:
-        text = extract_text_from_image(filepath)
-    elif file_ext == '.xlsx':
-        text = extract_text_from_excel(filepath)
-    elif file_ext == '.xls':
-        text = extract_text_from_xls(filepath)
-    else:
+    # Extraction engine can be chosen per request
+    engine = request.form.get('engine', extraction_engine)
+    if engine not in EXTRACTION_ENGINES:
+        return jsonify({'error': 'Unsupported extraction engine'}), 400
+
+    # The parser is chosen from the file's leading bytes, not from its client-supplied name
+    with metrics.span('upload_sniff'):
+        file_ext = sniff_format(file.stream)
+    if file_ext is None:
         return jsonify({'error': 'Unsupported file type'}), 400
 
-    # Save the extracted text into a .txt file
-    text_filename = os.path.splitext(file.filename)[0] + '.txt'
-    text_filepath = os.path.join(TEXT_FOLDER, text_filename)
-    with open(text_filepath, 'w') as text_file:
-        text_file.write(text)
+    # A revised contract names the upload it revises; its stored text is read now, before this
+    # upload's text can overwrite it
+    previous_text = None
+    revision_of = request.form.get('revisionOf')
+    if revision_of:
+        previous_text = read_stored_text(secure_filename(revision_of))
+        if previous_text is None:
+            return jsonify({'error': 'No stored text for the revised contract'}), 404
 
-    # Process the extracted text with the AI model
-    processed_text = process_contract(text)
-    
-    # Generate a unique invoice based on the uploaded file
-    invoice_path = generate_invoice_from_text(processed_text, os.path.splitext(file.filename)[0])
+    # The spooled upload is handed to the job as it is, without saving and reopening it
+    filename = secure_filename(file.filename) or f'contract{file_ext}'
+    stream = detach_upload(file)
+    try:
+        job_id = job_queue.submit(convert_upload, stream, filename, engine, file_ext=file_ext, previous_text=previous_text,
+                                  priority=priority, on_finish=stream.close)
+    except QueueFullError as e:
+        stream.close()
+        return queue_full(e)
 
-    # Return the URL to download the generated invoice and the extracted text file
     return jsonify({
-        'invoiceUrl': f'/api/download-invoice/{os.path.basename(invoice_path)}'
+        'jobId': job_id,
+        'statusUrl': f'/api/jobs/{job_id}',
+        'resultUrl': f'/api/jobs/{job_id}/result',
+        'eventsUrl': f'/api/jobs/{job_id}/events'
+    }), 202
+
+@app.route('/api/convert-batch', methods=['POST'])
+def convert_batch_endpoint():
+    # Many contracts at once: several 'contracts' files, ZIP archives of contracts, or both
+    # Batches queue behind single uploads unless asked otherwise
+    priority = get_priority('low')
+    if priority is None:
+        return jsonify({'error': 'Unsupported priority'}), 400
+    # A batch converts llm_workers files at once and takes a job worker slot for each, never the slots kept
+    # for single uploads
+    llm_workers = job_queue.slots_for('batch', BATCH_LLM_WORKERS)
+    try:
+        job_queue.check_admission(priority, slots=llm_workers, kind='batch')
+    except QueueFullError as e:
+        return queue_full(e)
+
+    request.max_content_length = MAX_BATCH_UPLOAD_BYTES
+    uploads = [file for file in request.files.getlist('contracts') if file.filename]
+    if not uploads:
+        return jsonify({'error': 'No files in the contracts field'}), 400
+
+    engine = request.form.get('engine', extraction_engine)
+    if engine not in EXTRACTION_ENGINES:
+        return jsonify({'error': 'Unsupported extraction engine'}), 400
+
+    # Each batch gets its own upload folder, so files of different batches never overwrite each other
+    batch_id = uuid.uuid4().hex
+    batch_folder = BatchFolder(os.path.join(UPLOAD_FOLDER, f'batch_{batch_id}'), SUPPORTED_EXTENSIONS)
+    try:
+        with metrics.span('upload_save'):
+            for file in uploads:
+                batch_folder.add_upload(file)
+    except BatchTooLargeError as e:
+        batch_folder.discard()
+        return jsonify({'error': f'Batch too large: {e}'}), 413
+    if not batch_folder.files:
+        batch_folder.discard()
+        return jsonify({'error': 'No supported files in the batch', 'skipped': batch_folder.skipped}), 400
+
+    # The whole batch is one job; its files are converted in parallel inside it
+    leases.acquire(batch_folder.folder)
+    try:
+        job_id = job_queue.submit(convert_batch, batch_id, batch_folder.files, batch_folder.skipped, engine, llm_workers,
+                                  priority=priority, kind='batch', slots=llm_workers, units=len(batch_folder.files),
+                                  on_finish=lambda: leases.release(batch_folder.folder))
+    except QueueFullError as e:
+        leases.release(batch_folder.folder)
+        batch_folder.discard()
+        return queue_full(e)
+
+    return jsonify({
+        'jobId': job_id,
+        'batchId': batch_id,
+        'files': len(batch_folder.files),
+        'skipped': len(batch_folder.skipped),
+        'statusUrl': f'/api/jobs/{job_id}',
+        'resultUrl': f'/api/jobs/{job_id}/result',
+        'eventsUrl': f'/api/jobs/{job_id}/events'
+    }), 202
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'Upload larger than {request.max_content_length} bytes'}), 413
+
+@app.route('/api/queue/stats', methods=['GET'])
+def queue_stats():
+    # Workers, queue depth by priority and the admission limits
+    return jsonify(job_queue.get_stats())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Report the state of a conversion job
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({
+        'jobId': job_id,
+        'state': job['state'],
+        'priority': job['priority'],
+        'created': job['created'],
+        'started': job['started'],
+        'finished': job['finished'],
+        'error': job['error']
+    })
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    # Return the invoice URL once the conversion job is done
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['state'] == FAILED:
+        return jsonify({'error': job['error']}), 500
+    if job['state'] == CANCELLED:
+        return jsonify({'error': 'Job was cancelled'}), 410
+    if job['state'] != DONE:
+        return jsonify({'state': job['state']}), 202
+    return jsonify(job['result'])
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    # Server-sent events: text extracted, main analysis tokens, each completed section, invoice ready
+    if job_queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    # A reconnecting EventSource resumes after the last event it received
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    start = int(last_event_id) + 1 if last_event_id.isdigit() else 0
+
+    def stream():
+        for item in job_queue.iter_events(job_id, start):
+            if item is None:
+                yield ': heartbeat\n\n'
+                continue
+            index, event = item
+            yield f"id: {index}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    # Stop a job early, e.g. when the streamed main analysis is clearly wrong
+    if not job_queue.cancel(job_id):
+        return jsonify({'error': 'Job not found or already finished'}), 404
+    return jsonify({'jobId': job_id, 'cancelRequested': True})
+
+# Send a blob of the invoice store as an attachment; clients revalidate with If-None-Match and get a 304
+def send_stored(filename, mimetype):
+    with leases.hold(os.path.join(INVOICE_FOLDER, filename)):
+        blob = invoice_store.get(filename)
+    if blob is None:
+        return jsonify({'error': 'File not found'}), 404
+    data, etag = blob
+    response = Response(data, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers.set('Content-Disposition', 'attachment', filename=filename)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/download-invoice/<filename>', methods=['GET'])
 def download_invoice(filename):
     # Send the specified invoice file
-    invoice_path = os.path.join(INVOICE_FOLDER, filename)
-    if os.path.exists(invoice_path):
-        return send_file(invoice_path, as_attachment=True, download_name=filename, mimetype='application/pdf')
-    else:
+    return send_stored(filename, 'application/pdf')
+
+@app.route('/api/download-batch/<filename>', methods=['GET'])
+def download_batch(filename):
+    # Send the ZIP of invoices and manifest of a finished batch
+    if not filename.endswith('.zip'):
         return jsonify({'error': 'File not found'}), 404
+    return send_stored(filename, 'application/zip')
 
 @app.route('/api/download-text/<filename>', methods=['GET'])
 def download_text(filename):
     # Send the extracted text file
     text_filepath = os.path.join(TEXT_FOLDER, filename)
-    if os.path.exists(text_filepath):
-        return send_file(text_filepath, as_attachment=True, download_name=filename)
-    else:
-        return jsonify({'error': 'File not found'}), 404
+    with leases.hold(text_filepath):
+        if os.path.exists(text_filepath):
+            return send_file(text_filepath, as_attachment=True, download_name=filename)
+        else:
+            return jsonify({'error': 'File not found'}), 404
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus scrape endpoint: stage timings, LLM token counts and durations, cache and queue state
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    # Readiness probe: 200 once the model is warmed up and loaded in Ollama, 503 before that
+    report = llm_client.readiness()
+    return jsonify(report), 200 if report['ready'] else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    # Hit and miss counters of the result cache
+    return jsonify(result_cache.get_stats())
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def cache_invalidate():
+    # Drop every cached result, e.g. after editing a prompt without restarting
+    removed = result_cache.invalidate()
+    return jsonify({'removed': removed})
+
+@app.route('/api/retention/stats', methods=['GET'])
+def retention_stats():
+    # Quotas, current size and last sweep of each retention-managed folder
+    return jsonify(retention_daemon.get_stats())
 
+# Development server only; in production run gunicorn with gunicorn.conf.py (see there)
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
@@ -0,0 +1,183 @@
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from werkzeug.utils import secure_filename
+
+from jobs import JobCancelled
+
+# Files of one batch converted at the same time; each stage has its own limit so text extraction of the
+# next files overlaps with the LLM calls of the current ones
+BATCH_EXTRACTION_WORKERS = min(4, os.cpu_count() or 1)
+BATCH_LLM_WORKERS = 2
+
+# Limits on what one batch request may contain, after ZIP archives are unpacked
+BATCH_MAX_FILES = 500
+BATCH_MAX_UNPACKED_BYTES = 1024 * 1024 * 1024
+
+# Manifest statuses
+CONVERTED = 'converted'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class BatchTooLargeError(Exception):
+    """Raised when an upload exceeds BATCH_MAX_FILES or BATCH_MAX_UNPACKED_BYTES."""
+
+
+def safe_filename(filename, file_ext):
+    """filename made safe for the upload folder and for URLs, as single uploads are; contract{file_ext} when
+    nothing of it survives (secure_filename drops non-ASCII stems, and with them the dot of the extension).
+    """
+    name = secure_filename(filename)
+    stem, ext = os.path.splitext(name)
+    if not stem or ext.lower() != file_ext:
+        return f'contract{file_ext}'
+    return name
+
+
+def unique_filename(filename, used):
+    """filename, with a counter after its stem if the batch already has a file with that stem.
+
+    Text files and invoices are named after the stem, so contract.pdf and contract.docx must not share one.
+    """
+    base, ext = os.path.splitext(filename)
+    candidate = base
+    counter = 1
+    while candidate.lower() in used:
+        counter += 1
+        candidate = f'{base}_{counter}'
+    used.add(candidate.lower())
+    return candidate + ext
+
+
+class BatchFolder:
+    """Upload folder of one batch: saves uploaded files, unpacks ZIP archives and records skipped entries."""
+
+    def __init__(self, folder, supported_extensions):
+        self.folder = folder
+        self.supported_extensions = supported_extensions
+        self.files = []
+        self.skipped = []
+        self.used_names = set()
+        self.unpacked_bytes = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def check_limits(self, size):
+        if len(self.files) >= BATCH_MAX_FILES:
+            raise BatchTooLargeError(f'more than {BATCH_MAX_FILES} files')
+        if self.unpacked_bytes + size > BATCH_MAX_UNPACKED_BYTES:
+            raise BatchTooLargeError(f'more than {BATCH_MAX_UNPACKED_BYTES} bytes')
+        self.unpacked_bytes += size
+
+    def discard(self):
+        """Delete the folder with everything saved so far, for a batch that is refused."""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def add_upload(self, file):
+        """Save one werkzeug FileStorage; ZIP archives are unpacked into the batch."""
+        filename = os.path.basename(file.filename or '')
+        file_ext = os.path.splitext(filename)[1].lower()
+        if file_ext == '.zip':
+            self.add_zip(file.stream, filename)
+            return
+        if file_ext not in self.supported_extensions:
+            self.skipped.append({'filename': filename, 'source': None, 'status': SKIPPED, 'error': 'Unsupported file type'})
+            return
+
+        # The spooled upload is measured before anything is written to the batch folder
+        file.stream.seek(0, os.SEEK_END)
+        self.check_limits(file.stream.tell())
+        file.stream.seek(0)
+        name = unique_filename(safe_filename(filename, file_ext), self.used_names)
+        path = os.path.join(self.folder, name)
+        file.save(path)
+        self.files.append({'filename': name, 'source': None, 'path': path})
+
+    def add_zip(self, stream, archive_name):
+        try:
+            archive = zipfile.ZipFile(stream)
+        except zipfile.BadZipFile:
+            self.skipped.append({'filename': archive_name, 'source': None, 'status': SKIPPED, 'error': 'Not a valid ZIP archive'})
+            return
+
+        with archive:
+            for info in archive.infolist():
+                # Folder structure inside the archive is flattened; hidden files and macOS metadata are ignored
+                filename = os.path.basename(info.filename.replace('\\', '/'))
+                if info.is_dir() or not filename or filename.startswith('.') or '__MACOSX/' in info.filename:
+                    continue
+                file_ext = os.path.splitext(filename)[1].lower()
+                if file_ext not in self.supported_extensions:
+                    self.skipped.append({'filename': filename, 'source': archive_name, 'status': SKIPPED, 'error': 'Unsupported file type'})
+                    continue
+
+                self.check_limits(info.file_size)
+                name = unique_filename(safe_filename(filename, file_ext), self.used_names)
+                path = os.path.join(self.folder, name)
+                with archive.open(info) as source, open(path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                self.files.append({'filename': name, 'source': archive_name, 'path': path})
+
+
+def run_batch(files, convert_file, extraction_workers=None, llm_workers=None, progress=None):
+    """Convert every file of a batch and return one manifest entry per file, in upload order.
+
+    convert_file(entry, extraction_slot, llm_slot) converts one file, holding extraction_slot while it
+    extracts text and llm_slot while it calls the model; it returns the manifest fields of a converted
+    file. An exception fails only that file, except JobCancelled, which stops the whole batch.
+    """
+    if progress is None:
+        progress = lambda event, data=None: None
+    extraction_workers = extraction_workers or BATCH_EXTRACTION_WORKERS
+    llm_workers = llm_workers or BATCH_LLM_WORKERS
+    extraction_slot = threading.BoundedSemaphore(extraction_workers)
+    llm_slot = threading.BoundedSemaphore(llm_workers)
+    results = [None] * len(files)
+    completed = 0
+
+    def run_file(entry):
+        start = time.perf_counter()
+        try:
+            fields = convert_file(entry, extraction_slot, llm_slot)
+        except JobCancelled:
+            raise
+        except Exception as e:
+            print(f"Batch file {entry['filename']} failed: {e}")
+            fields = {'status': FAILED, 'error': str(e)}
+        else:
+            fields = dict(fields, status=CONVERTED)
+        fields.update(filename=entry['filename'], source=entry['source'], seconds=round(time.perf_counter() - start, 3))
+        return fields
+
+    # Enough threads to keep both stages busy; the semaphores, not the pool, bound each stage
+    with ThreadPoolExecutor(max_workers=extraction_workers + llm_workers, thread_name_prefix='batch') as executor:
+        futures = {executor.submit(run_file, entry): index for index, entry in enumerate(files)}
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                completed += 1
+                progress('file_completed', dict(results[index], completed=completed, total=len(files)))
+        except JobCancelled:
+            for future in futures:
+                future.cancel()
+            raise
+    return results
+
+
+def build_archive(manifest, invoice_store):
+    """ZIP bytes with every generated invoice of the manifest plus manifest.json."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for entry in manifest:
+            blob = invoice_store.get(entry['invoice']) if entry.get('invoice') else None
+            if blob is not None:
+                archive.writestr(entry['invoice'], blob[0])
+        archive.writestr('manifest.json', json.dumps(manifest, indent=4, ensure_ascii=False))
+    return buffer.getvalue()
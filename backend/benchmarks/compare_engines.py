@@ -0,0 +1,104 @@
+# Side-by-side latency and token comparison of the 'pipeline' and 'consolidated' extraction engines.
+#
+# Runs against a real Ollama with -host, or by default against the stand-in server, which models prefill
+# and generation time per token, so the call and token counts compare the same way.
+#
+# Usage (from the backend folder):
+#   python benchmarks/compare_engines.py -path text_files/contract.txt -runs 3 -output engines.json
+#   python benchmarks/compare_engines.py -path text_files/contract.txt -host http://127.0.0.1:11434
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+# Wrap llm_client.chat so every call made by an engine reports its token counts and durations
+class ChatRecorder:
+    def __init__(self, chat):
+        self.chat = chat
+        self.calls = []
+
+    def __call__(self, *args, **kwargs):
+        response = self.chat(*args, **kwargs)
+        self.calls.append({
+            'prompt_eval_count': response.get('prompt_eval_count') or 0,
+            'eval_count': response.get('eval_count') or 0,
+            'prompt_eval_duration': response.get('prompt_eval_duration') or 0,
+            'eval_duration': response.get('eval_duration') or 0,
+            'load_duration': response.get('load_duration') or 0,
+        })
+        return response
+
+
+def run_engine(ai_processing, engine, contract_data, runs):
+    recorder = ChatRecorder(ai_processing.llm_client.chat)
+    ai_processing.llm_client.chat = recorder
+    samples = []
+    try:
+        for _ in range(runs):
+            recorder.calls = []
+            start = time.perf_counter()
+            ai_processing.process_contract(contract_data, engine=engine)
+            elapsed = time.perf_counter() - start
+            samples.append({
+                'seconds': elapsed,
+                'calls': len(recorder.calls),
+                'prompt_tokens': sum(call['prompt_eval_count'] for call in recorder.calls),
+                'output_tokens': sum(call['eval_count'] for call in recorder.calls),
+                'prefill_seconds': sum(call['prompt_eval_duration'] for call in recorder.calls) / 1e9,
+                'generation_seconds': sum(call['eval_duration'] for call in recorder.calls) / 1e9,
+            })
+    finally:
+        ai_processing.llm_client.chat = recorder.chat
+
+    summary = {'engine': engine, 'runs': samples}
+    for key in ['seconds', 'calls', 'prompt_tokens', 'output_tokens', 'prefill_seconds', 'generation_seconds']:
+        summary[f'median_{key}'] = statistics.median(sample[key] for sample in samples)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pipeline and consolidated extraction engines.")
+    parser.add_argument('-path', type=str, required=True, help="Path to the contract text file")
+    parser.add_argument('-runs', type=int, default=3, help="Number of runs per engine")
+    parser.add_argument('-host', type=str, help="Ollama server to measure instead of the stand-in")
+    parser.add_argument('-prefill-latency', type=float, default=0.0005, help="Stand-in: seconds per prompt token")
+    parser.add_argument('-token-latency', type=float, default=0.02, help="Stand-in: seconds per generated token")
+    parser.add_argument('-output', type=str, help="Optional path of a JSON file for the results")
+    args = parser.parse_args()
+
+    with open(args.path, 'r') as file:
+        contract_data = file.read()
+
+    server = None
+    if args.host is None:
+        from fake_ollama import FakeOllamaServer
+        server = FakeOllamaServer(prefill_latency=args.prefill_latency, token_latency=args.token_latency).start()
+        args.host = server.url
+
+    import llm_client
+    llm_client.OLLAMA_HOST = args.host
+    import ai_processing
+
+    results = [run_engine(ai_processing, engine, contract_data, args.runs) for engine in ai_processing.EXTRACTION_ENGINES]
+    if server is not None:
+        server.shutdown()
+
+    print(f"{'engine':<14}{'calls':>7}{'seconds':>10}{'prompt tok':>12}{'output tok':>12}{'prefill s':>11}{'gen s':>9}")
+    for summary in results:
+        print(f"{summary['engine']:<14}{summary['median_calls']:>7}{summary['median_seconds']:>10.2f}"
+              f"{summary['median_prompt_tokens']:>12}{summary['median_output_tokens']:>12}"
+              f"{summary['median_prefill_seconds']:>11.2f}{summary['median_generation_seconds']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'model': ai_processing.ml_model, 'host': args.host, 'contract': args.path, 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+# Stand-in Ollama HTTP server returning canned, deterministic responses with configurable latency.
+#
+# It answers the endpoints the backend uses (/api/chat, /api/generate, /api/ps, /api/tags), so the
+# pipeline can be benchmarked and regression-tested without a GPU, a model or a running Ollama.
+#
+# Usage:
+#   python benchmarks/fake_ollama.py -port 11434 -latency 0.2 -token-latency 0.001
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from section_schemas import SECTION_SCHEMAS, get_consolidated_schema
+
+# Title line of each secondary prompt, used to tell which section a format='json' call asks for
+SECTION_TITLES = {
+    "invoice_information": "1. Invoice Information & Client Data",
+    "service_details": "2. Description or Details of Products/Services",
+    "calculation_details": "3. Calculation Details",
+    "payment_instructions": "4. Payment Instructions",
+    "special_conditions": "5. Special Conditions or Clauses",
+    "customer_information": "6. Customer Information\n",
+    "additional_information": "7. Additional Detected Information\n",
+}
+
+MAIN_RESULT = """Contract Information: contract period from 01.01.2024 to 31.12.2024, Annex 1 referenced.
+Billing and Payment Terms: monthly fee 1000 EUR, total contract value 12000 EUR, due within 30 days.
+Payment Instructions: IBAN MD24AG000225100013104168, SWIFT AGRNMD2X.
+Client: SRL Client Test, str. Stefan cel Mare 1, Chisinau, client@example.com, +373 22 000000.
+Services: software maintenance, one month per invoice.
+Tax: VAT 20%."""
+
+# Canned leaf values, so parsed invoices look like real ones
+SAMPLE_VALUES = {
+    "invoice_number": "INV-2024-001",
+    "invoice_date": "2024-01-31",
+    "due_date": "2024-02-29",
+    "iban": "MD24AG000225100013104168",
+    "swift_bic": "AGRNMD2X",
+    "currency": "EUR",
+    "total_amount": "1000.00",
+    "total_amount_due": "1200.00",
+    "subtotal": "1000.00",
+    "tax_rate": "20%",
+    "tax_amount": "200.00",
+    "quantity": "1",
+    "rate_per_unit": "1000.00",
+}
+
+
+def sample_from_schema(schema, name=''):
+    """Deterministic instance of a JSON schema."""
+    if schema.get('type') == 'object':
+        return {field: sample_from_schema(field_schema, field) for field, field_schema in schema.get('properties', {}).items()}
+    if schema.get('type') == 'array':
+        return [sample_from_schema(schema['items'], name)]
+    return SAMPLE_VALUES.get(name, f"Sample {name.replace('_', ' ')}")
+
+
+def canned_content(body):
+    """Response text for a chat or generate request, based on its format and prompt."""
+    response_format = body.get('format')
+    messages = body.get('messages') or [{'content': body.get('prompt') or ''}]
+    prompt = '\n'.join(message.get('content', '') for message in messages)
+
+    if isinstance(response_format, dict):
+        data = sample_from_schema(response_format)
+        if 'main_result' in data:
+            data['main_result'] = MAIN_RESULT
+        return json.dumps(data)
+    if response_format == 'json':
+        for section, title in SECTION_TITLES.items():
+            if title in prompt:
+                return json.dumps(sample_from_schema(SECTION_SCHEMAS[section]))
+        return json.dumps(sample_from_schema(get_consolidated_schema()))
+    return MAIN_RESULT
+
+
+def count_tokens(text):
+    return len(text) // 4 + 1
+
+
+def render_prompt(body):
+    """Prompt text as the model sees it, messages in order with their roles, for prefix matching."""
+    if body.get('messages'):
+        return ''.join(f"<{message.get('role', 'user')}>{message.get('content', '')}</{message.get('role', 'user')}>" for message in body['messages'])
+    return body.get('prompt') or ''
+
+
+def common_prefix_length(a, b):
+    length = min(len(a), len(b))
+    for index in range(length):
+        if a[index] != b[index]:
+            return index
+    return length
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        payload = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == '/api/ps':
+            models = [{'name': model, 'model': model, 'size': 0, 'digest': '', 'expires_at': None, 'size_vram': 0}
+                      for model in sorted(self.server.loaded_models)]
+            self.send_json({'models': models})
+        elif self.path == '/api/tags':
+            self.send_json({'models': []})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self.path not in ('/api/chat', '/api/generate'):
+            self.send_json({'error': 'not found'}, 404)
+            return
+
+        server = self.server
+        model = body.get('model', '')
+        name = model if ':' in model else f'{model}:latest'
+        options = body.get('options') or {}
+        prompt = render_prompt(body)
+        with server.lock:
+            server.requests += 1
+            # Like Ollama, a different num_ctx reloads the model, which also drops its cached prefixes
+            num_ctx = options.get('num_ctx')
+            reload = name not in server.loaded_models or server.model_contexts.get(name) != num_ctx
+            load_seconds = server.load_latency if reload else 0.0
+            if reload:
+                server.reloads += 1
+                server.prompt_cache[name] = []
+            server.loaded_models.add(name)
+            server.model_contexts[name] = num_ctx
+            cached_chars = max([common_prefix_length(prompt, cached) for cached in server.prompt_cache[name]], default=0)
+
+        is_chat = self.path == '/api/chat'
+        prompt_text = json.dumps(body.get('messages') or body.get('prompt') or '')
+        content = canned_content(body) if (body.get('messages') or body.get('prompt')) else ''
+        # Only the part of the prompt past the longest cached prefix is prefilled and counted
+        cached_tokens = count_tokens(prompt[:cached_chars]) - 1 if server.prefix_cache_slots else 0
+        prompt_tokens = max(1, count_tokens(prompt_text) - cached_tokens)
+        tokens = content.split(' ')
+        done_reason = 'stop'
+        if options.get('num_predict') and len(tokens) > options['num_predict']:
+            tokens = tokens[:options['num_predict']]
+            content = ' '.join(tokens)
+            done_reason = 'length'
+        prefill_seconds = server.latency + prompt_tokens * server.prefill_latency
+        time.sleep(load_seconds + prefill_seconds)
+
+        if server.prefix_cache_slots and prompt:
+            with server.lock:
+                # The prefilled prompt takes the slot of the least recently used one
+                slots = server.prompt_cache[name]
+                slots.append(prompt)
+                del slots[:-server.prefix_cache_slots]
+
+        stats = {
+            'model': model,
+            'created_at': '2024-01-01T00:00:00Z',
+            'done': True,
+            'done_reason': done_reason,
+            'total_duration': 0,
+            'load_duration': int(load_seconds * 1e9),
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': int(prefill_seconds * 1e9),
+            'eval_count': len(tokens) if content else 0,
+            'eval_duration': int(len(tokens) * server.token_latency * 1e9) if content else 0,
+        }
+
+        if body.get('stream', True) is False:
+            time.sleep(len(tokens) * server.token_latency if content else 0)
+            message = {'message': {'role': 'assistant', 'content': content}} if is_chat else {'response': content}
+            self.send_json(dict(stats, **message))
+            return
+
+        # Newline-delimited JSON stream, one token per line
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [token + (' ' if index < len(tokens) - 1 else '') for index, token in enumerate(tokens)] if content else []
+        for piece in pieces:
+            time.sleep(server.token_latency)
+            chunk = {'model': model, 'created_at': stats['created_at'], 'done': False}
+            chunk.update({'message': {'role': 'assistant', 'content': piece}} if is_chat else {'response': piece})
+            self.write_chunk(chunk)
+        final = dict(stats, **({'message': {'role': 'assistant', 'content': ''}} if is_chat else {'response': ''}))
+        self.write_chunk(final)
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data):
+        line = (json.dumps(data) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(line):x}\r\n'.encode('ascii') + line + b'\r\n')
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, token_latency=0.0, prefill_latency=0.0, load_latency=0.0, prefix_cache_slots=0):
+        super().__init__(('127.0.0.1', port), FakeOllamaHandler)
+        self.latency = latency
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.load_latency = load_latency
+        # Prompts kept per model for KV-cache prefix reuse, like Ollama's parallel slots; 0 disables it
+        self.prefix_cache_slots = prefix_cache_slots
+        self.prompt_cache = {}
+        self.model_contexts = {}
+        self.loaded_models = set()
+        self.requests = 0
+        self.reloads = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-ollama', daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in Ollama server with canned responses.")
+    parser.add_argument('-port', type=int, default=11434, help="Port to listen on")
+    parser.add_argument('-latency', type=float, default=0.0, help="Fixed seconds added to every call")
+    parser.add_argument('-token-latency', type=float, default=0.0, help="Seconds per generated token")
+    parser.add_argument('-prefill-latency', type=float, default=0.0, help="Seconds per prompt token")
+    parser.add_argument('-load-latency', type=float, default=0.0, help="Seconds for the first call to each model")
+    parser.add_argument('-prefix-cache-slots', type=int, default=0, help="Prompts cached per model for prefix reuse (0 = none)")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.port, args.latency, args.token_latency, args.prefill_latency, args.load_latency,
+                              args.prefix_cache_slots)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
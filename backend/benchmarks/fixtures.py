@@ -0,0 +1,131 @@
+# Deterministic fixture contracts in every upload format the backend accepts.
+#
+# Usage:
+#   python benchmarks/fixtures.py -folder /tmp/contracts -pages 10
+import argparse
+import os
+
+from PIL import Image, ImageDraw
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+import docx
+import openpyxl
+
+CONTRACT_HEADER = [
+    "CONTRACT DE PRESTARI SERVICII Nr. 42/2024",
+    "Chisinau, 01.01.2024",
+    "1. Partile contractului",
+    "Prestator: SRL Furnizor Test, IDNO 1003600012345, IBAN MD24AG000225100013104168, SWIFT AGRNMD2X",
+    "Beneficiar: SRL Client Test, IDNO 1012600054321, str. Stefan cel Mare 1, Chisinau, client@example.com",
+    "2. Obiectul contractului",
+    "Prestatorul presteaza servicii de mentenanta software pe perioada 01.01.2024 - 31.12.2024.",
+    "3. Pretul si modalitatea de plata",
+    "Pretul lunar este de 1000 EUR fara TVA, TVA 20%. Plata se efectueaza in termen de 30 zile de la factura.",
+    "Pentru intarzierea platii se aplica o penalitate de 0,1% pe zi.",
+]
+
+
+def contract_lines(pages, lines_per_page=40):
+    """Contract text: a fixed header followed by numbered clauses, about lines_per_page lines per page."""
+    lines = list(CONTRACT_HEADER)
+    clause = 0
+    while len(lines) < pages * lines_per_page:
+        clause += 1
+        lines.append(f"4.{clause} Prestatorul va presta serviciile din Anexa {clause % 5 + 1} conform graficului lunar convenit.")
+    return lines
+
+
+def billing_rows(rows):
+    """Rows of a billing annex: header plus one line per service day."""
+    data = [["Nr", "Serviciu", "Unitate", "Cantitate", "Pret unitar", "Suma", "Valuta"]]
+    for index in range(1, rows + 1):
+        data.append([index, f"Mentenanta software ziua {index}", "zi", 1, 45.5, 45.5, "EUR"])
+    return data
+
+
+def write_pdf(path, pages):
+    c = canvas.Canvas(path, pagesize=A4)
+    lines = contract_lines(pages)
+    for start in range(0, len(lines), 40):
+        y = 800
+        for line in lines[start:start + 40]:
+            c.drawString(40, y, line)
+            y -= 18
+        c.showPage()
+    c.save()
+
+
+def write_docx(path, pages):
+    document = docx.Document()
+    for line in contract_lines(pages):
+        document.add_paragraph(line)
+    document.save(path)
+
+
+def write_png(path, dpi=300):
+    # One A4 page scanned at the given DPI
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    y = dpi
+    for line in contract_lines(1)[:30]:
+        draw.text((dpi // 2, y), line, fill=0, font_size=dpi // 10)
+        y += dpi // 6
+    image.save(path, dpi=(dpi, dpi))
+
+
+def write_xlsx(path, rows):
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = "Anexa 1"
+    for row in billing_rows(rows):
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def write_xls(path, rows):
+    # xlwt is only needed to generate this fixture, not by the backend
+    import xlwt
+    workbook = xlwt.Workbook()
+    worksheet = workbook.add_sheet("Anexa 1")
+    for row_index, row in enumerate(billing_rows(min(rows, 65535))):
+        for column_index, value in enumerate(row):
+            worksheet.write(row_index, column_index, value)
+    workbook.save(path)
+
+
+def generate_corpus(folder, pages=10, rows=5000):
+    """Write one fixture per format into folder; returns {extension: path} for the formats that could be written."""
+    os.makedirs(folder, exist_ok=True)
+    writers = {
+        '.pdf': lambda path: write_pdf(path, pages),
+        '.docx': lambda path: write_docx(path, pages),
+        '.png': write_png,
+        '.xlsx': lambda path: write_xlsx(path, rows),
+        '.xls': lambda path: write_xls(path, rows),
+    }
+    corpus = {}
+    for extension, write in writers.items():
+        path = os.path.join(folder, f'contract{extension}')
+        try:
+            write(path)
+        except ImportError as e:
+            print(f"Skipping {extension} fixture: {e}")
+            continue
+        corpus[extension] = path
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate fixture contracts in every supported format.")
+    parser.add_argument('-folder', type=str, required=True, help="Folder to write the fixtures to")
+    parser.add_argument('-pages', type=int, default=10, help="Pages of the PDF and DOCX contracts")
+    parser.add_argument('-rows', type=int, default=5000, help="Rows of the XLSX and XLS billing annexes")
+    args = parser.parse_args()
+
+    for extension, path in generate_corpus(args.folder, args.pages, args.rows).items():
+        print(f"{extension:<6}{path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# Cold-start benchmark: how long a fresh interpreter takes to import the backend, and what each
+# extractor's first use costs once the lazy registry imports it.
+#
+# Every run is a new Python process started in a throwaway folder, so nothing is cached in sys.modules.
+# Reports the median wall time of `import app`, the peak RSS after it, the heavy libraries loaded at
+# startup, and the import time of each extractor on first use.
+#
+# Usage (from the backend folder):
+#   python benchmarks/import_time.py -runs 10 -output import_time.json
+#   python benchmarks/import_time.py -compare import_time.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Libraries whose presence in sys.modules after `import app` is reported
+HEAVY_MODULES = ['PyPDF2', 'docx', 'PIL', 'pytesseract', 'openpyxl', 'xlrd', 'reportlab', 'ollama', 'flask']
+
+# Run in the child process; prints one JSON line
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+import_seconds = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+loaded = [name for name in HEAVY if name in sys.modules]
+first_use = {}
+import extractors
+for mime_type in extractors.EXTRACTORS:
+    start = time.perf_counter()
+    try:
+        extractors.get_extractor(mime_type)
+    except ImportError as e:
+        first_use[mime_type] = None
+        continue
+    first_use[mime_type] = time.perf_counter() - start
+print('RESULT ' + json.dumps({'import_seconds': import_seconds, 'rss_kb': rss_kb, 'loaded': loaded, 'first_use_seconds': first_use}))
+"""
+
+
+def run_probe(work_folder):
+    env = dict(os.environ, PYTHONPATH=BACKEND_FOLDER, PYTHONDONTWRITEBYTECODE='1')
+    # No model server is needed; the warm-up thread fails fast against a closed port
+    env.setdefault('OLLAMA_HOST', 'http://127.0.0.1:9')
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{PROBE}"
+    output = subprocess.run([sys.executable, '-c', code], cwd=work_folder, env=env, capture_output=True, text=True, check=True).stdout
+    line = next(line for line in output.splitlines() if line.startswith('RESULT '))
+    return json.loads(line[len('RESULT '):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the backend's cold-start import time.")
+    parser.add_argument('-runs', type=int, default=5, help="Fresh processes to measure")
+    parser.add_argument('-output', type=str, default='import_time.json', help="JSON file for the results")
+    parser.add_argument('-compare', type=str, help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    work_folder = tempfile.mkdtemp(prefix='contract-import-')
+    samples = [run_probe(work_folder) for _ in range(args.runs)]
+
+    first_use = {}
+    for mime_type in samples[0]['first_use_seconds']:
+        values = [sample['first_use_seconds'][mime_type] for sample in samples if sample['first_use_seconds'][mime_type] is not None]
+        first_use[mime_type] = statistics.median(values) if values else None
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': args.runs,
+        'median_import_seconds': statistics.median(sample['import_seconds'] for sample in samples),
+        'min_import_seconds': min(sample['import_seconds'] for sample in samples),
+        'median_rss_mb': statistics.median(sample['rss_kb'] for sample in samples) / 1024,
+        'loaded_at_startup': samples[0]['loaded'],
+        'first_use_seconds': first_use,
+    }
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            previous = json.load(file)
+    change = ''
+    if previous:
+        change = f" ({(results['median_import_seconds'] / previous['median_import_seconds'] - 1) * 100:+.0f}% vs previous)"
+    print(f"import app: median {results['median_import_seconds']:.3f}s, min {results['min_import_seconds']:.3f}s{change}")
+    print(f"peak RSS after import: {results['median_rss_mb']:.1f} MB")
+    print(f"loaded at startup: {', '.join(results['loaded_at_startup']) or 'none of the heavy libraries'}")
+    print("first use of each extractor:")
+    for mime_type, seconds in first_use.items():
+        print(f"  {mime_type:<72}{'unavailable' if seconds is None else f'{seconds:.3f}s'}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Benchmark of the OCR pipeline (preprocessing, process pool, persistent tesseract API) in pages per second.
+#
+# Usage (from the backend folder, with tesseract installed):
+#   python benchmarks/ocr.py -pages 8 -runs 2
+#   python benchmarks/ocr.py -path uploads/scanned_contract.tiff -output ocr.json
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageSequence
+import pytesseract
+
+import ocr
+
+
+# OCR as it was before the OCR pipeline: full-resolution pages, one tesseract process per page
+def extract_text_baseline(file_path):
+    with Image.open(file_path) as image:
+        return '\n'.join(pytesseract.image_to_string(frame.copy()) for frame in ImageSequence.Iterator(image))
+
+
+# Multi-page 600 DPI scan, the size a phone or office scanner produces for an A4 contract
+def generate_scan(path, pages, dpi=600):
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    frames = []
+    for page in range(pages):
+        frame = Image.new('RGB', (width, height), (235, 232, 225))
+        draw = ImageDraw.Draw(frame)
+        y = dpi
+        for line in range(40):
+            draw.text((dpi, y), f"Clause {page + 1}.{line + 1}: The Provider shall invoice the services monthly.", fill=(30, 30, 30), font_size=dpi // 8)
+            y += dpi // 4
+        frames.append(frame)
+    frames[0].save(path, save_all=True, append_images=frames[1:], dpi=(dpi, dpi), compression='tiff_lzw')
+
+
+def time_runs(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR throughput in pages per second.")
+    parser.add_argument('-path', type=str, help="Image to OCR; a synthetic multi-page scan is generated when omitted")
+    parser.add_argument('-pages', type=int, default=8, help="Pages of the synthetic scan")
+    parser.add_argument('-runs', type=int, default=2, help="Runs per variant")
+    parser.add_argument('-output', type=str, help="Optional path of a JSON file for the results")
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'scan.tiff')
+        generate_scan(path, args.pages)
+    with Image.open(path) as image:
+        page_count = getattr(image, 'n_frames', 1)
+
+    variants = [
+        ('baseline', lambda: extract_text_baseline(path)),
+        ('preprocessed', lambda: ocr.extract_text_from_image(path, parallel=False)),
+        ('pool', lambda: ocr.extract_text_from_image(path, parallel=True)),
+    ]
+
+    results = []
+    for name, func in variants:
+        seconds = time_runs(func, args.runs)
+        results.append({'variant': name, 'seconds': seconds, 'pages_per_second': page_count / seconds})
+
+    print(f"{page_count} pages, median of {args.runs} runs, {ocr.OCR_WORKERS} workers, tesserocr: {ocr.get_tesserocr_api(ocr.OCR_LANG) is not None}")
+    print(f"{'variant':<14}{'seconds':>10}{'pages/s':>10}{'speedup':>10}")
+    for result in results:
+        print(f"{result['variant']:<14}{result['seconds']:>10.2f}{result['pages_per_second']:>10.2f}"
+              f"{results[0]['seconds'] / result['seconds']:>9.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'pages': page_count, 'cpu_count': os.cpu_count(), 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
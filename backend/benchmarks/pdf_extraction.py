@@ -0,0 +1,100 @@
+# Benchmark of page-parallel PDF text extraction against the original one-page-at-a-time loop.
+#
+# Usage (from the backend folder):
+#   python benchmarks/pdf_extraction.py -pages 150 -runs 3
+#   python benchmarks/pdf_extraction.py -path uploads/framework_agreement.pdf -output pdf.json
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfReader
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+import pdf_extraction
+
+
+# The extraction loop as it was before page-parallel extraction, kept as the baseline
+def extract_text_baseline(file_path):
+    reader = PdfReader(file_path)
+    text = ''
+    for page in reader.pages:
+        text += page.extract_text()
+    return text
+
+
+def generate_pdf(path, pages):
+    c = canvas.Canvas(path, pagesize=A4)
+    for page in range(pages):
+        y = 800
+        for line in range(60):
+            c.drawString(40, y, f"Clause {page + 1}.{line + 1}: The Provider shall render the services described in Annex {page % 7 + 1} at the agreed rate.")
+            y -= 12
+        c.showPage()
+    c.save()
+
+
+def time_runs(func, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        text = func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples), text
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sequential and page-parallel PDF text extraction.")
+    parser.add_argument('-path', type=str, help="PDF to extract; a synthetic contract is generated when omitted")
+    parser.add_argument('-pages', type=int, default=150, help="Pages of the synthetic contract")
+    parser.add_argument('-runs', type=int, default=3, help="Runs per variant")
+    parser.add_argument('-output', type=str, help="Optional path of a JSON file for the results")
+    args = parser.parse_args()
+
+    path = args.path
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), 'contract.pdf')
+        generate_pdf(path, args.pages)
+    page_count = len(PdfReader(path).pages)
+
+    variants = [
+        ('baseline', lambda: extract_text_baseline(path)),
+        ('sequential', lambda: pdf_extraction.extract_text_from_pdf(path, parallel=False)),
+    ]
+    for workers in sorted({2, 4, pdf_extraction.PDF_WORKERS}):
+        variants.append((f'parallel-{workers}', lambda workers=workers: pdf_extraction.extract_text_parallel(path, page_count, workers=workers)))
+
+    results = []
+    baseline_seconds = None
+    baseline_text = None
+    for name, func in variants:
+        seconds, text = time_runs(func, args.runs)
+        if baseline_seconds is None:
+            baseline_seconds, baseline_text = seconds, text
+        results.append({
+            'variant': name,
+            'seconds': seconds,
+            'pages_per_second': page_count / seconds,
+            'speedup': baseline_seconds / seconds,
+            'same_text': text == baseline_text,
+        })
+
+    print(f"{page_count} pages, median of {args.runs} runs")
+    print(f"{'variant':<14}{'seconds':>10}{'pages/s':>10}{'speedup':>10}{'same text':>11}")
+    for result in results:
+        print(f"{result['variant']:<14}{result['seconds']:>10.3f}{result['pages_per_second']:>10.1f}"
+              f"{result['speedup']:>9.2f}x{str(result['same_text']):>11}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'pages': page_count, 'cpu_count': os.cpu_count(), 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
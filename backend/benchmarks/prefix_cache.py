@@ -0,0 +1,106 @@
+# Prefill cost of the seven secondary prompts with and without the shared-prefix call layout.
+#
+# Runs run_secondary_extractions on the same main analysis once per layout, against the stand-in Ollama
+# server with prefix caching enabled (or against a real Ollama with -host), and reports the prompt tokens
+# actually evaluated and the prefill time. Ollama counts only the tokens past the cached prefix in
+# prompt_eval_count, so the numbers compare the same way on a real server.
+#
+# Usage (from the backend folder):
+#   python benchmarks/prefix_cache.py -runs 3 -prefill-latency 0.0005 -output prefix_cache.json
+#   python benchmarks/prefix_cache.py -host http://127.0.0.1:11434 -path text_files/analysis.txt
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from compare_engines import ChatRecorder
+from fake_ollama import MAIN_RESULT, FakeOllamaServer
+
+# (name, layout, prime_shared_prefix) of each configuration measured
+CONFIGURATIONS = [
+    ('instructions_first', 'instructions_first', False),
+    ('shared_prefix', 'shared_prefix', False),
+    ('shared_prefix+prime', 'shared_prefix', True),
+]
+
+
+def run_configuration(ai_processing, layout, prime, main_result, concurrency, runs):
+    ai_processing.secondary_prompt_layout = layout
+    ai_processing.prime_shared_prefix = prime
+    recorder = ChatRecorder(ai_processing.llm_client.chat)
+    ai_processing.llm_client.chat = recorder
+    samples = []
+    try:
+        for run in range(runs):
+            recorder.calls = []
+            # A different analysis per run, so no run starts with the previous run's prefix cached
+            analysis = f"Analysis {run} of contract {time.time_ns()}.\n{main_result}"
+            start = time.perf_counter()
+            ai_processing.run_secondary_extractions(analysis, concurrency)
+            samples.append({
+                'seconds': time.perf_counter() - start,
+                'calls': len(recorder.calls),
+                'prompt_tokens': sum(call['prompt_eval_count'] for call in recorder.calls),
+                'prefill_seconds': sum(call['prompt_eval_duration'] for call in recorder.calls) / 1e9,
+            })
+    finally:
+        ai_processing.llm_client.chat = recorder.chat
+
+    summary = {'layout': layout, 'prime_shared_prefix': prime, 'concurrency': concurrency, 'runs': samples}
+    for key in ['seconds', 'calls', 'prompt_tokens', 'prefill_seconds']:
+        summary[f'median_{key}'] = statistics.median(sample[key] for sample in samples)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure KV-cache prefix reuse across the secondary prompts.")
+    parser.add_argument('-path', type=str, help="Main analysis text to use (default: the canned analysis, repeated)")
+    parser.add_argument('-repeat', type=int, default=20, help="Repetitions of the canned analysis, for a realistic length")
+    parser.add_argument('-runs', type=int, default=3, help="Runs per configuration")
+    parser.add_argument('-host', type=str, help="Ollama server to measure instead of the stand-in")
+    parser.add_argument('-prefill-latency', type=float, default=0.0005, help="Stand-in: seconds per prompt token")
+    parser.add_argument('-slots', type=int, default=4, help="Stand-in: prompts cached per model")
+    parser.add_argument('-output', type=str, help="Optional path of a JSON file for the results")
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, 'r') as file:
+            main_result = file.read()
+    else:
+        main_result = '\n'.join([MAIN_RESULT] * args.repeat)
+
+    server = None
+    if args.host is None:
+        server = FakeOllamaServer(prefill_latency=args.prefill_latency, prefix_cache_slots=args.slots).start()
+        args.host = server.url
+
+    import llm_client
+    llm_client.OLLAMA_HOST = args.host
+    import ai_processing
+
+    results = []
+    for concurrency in (1, ai_processing.secondary_concurrency):
+        for name, layout, prime in CONFIGURATIONS:
+            summary = run_configuration(ai_processing, layout, prime, main_result, concurrency, args.runs)
+            summary['configuration'] = name
+            results.append(summary)
+    if server is not None:
+        server.shutdown()
+
+    print(f"{'configuration':<22}{'concurrency':>12}{'calls':>7}{'prompt tok':>12}{'prefill s':>11}{'seconds':>10}")
+    for summary in results:
+        print(f"{summary['configuration']:<22}{summary['concurrency']:>12}{summary['median_calls']:>7}"
+              f"{summary['median_prompt_tokens']:>12}{summary['median_prefill_seconds']:>11.3f}{summary['median_seconds']:>10.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'model': ai_processing.ml_model, 'host': args.host, 'results': results}, file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
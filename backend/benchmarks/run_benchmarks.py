@@ -0,0 +1,153 @@
+# Per-stage benchmark of the contract pipeline against a stand-in Ollama server.
+#
+# Times every text extractor, process_contract (both engines) and invoice rendering to disk and to
+# memory on a generated fixture corpus, and writes the results as JSON so runs
+# from different commits can be compared.
+#
+# Usage (from the backend folder):
+#   python benchmarks/run_benchmarks.py -runs 5 -output bench.json
+#   python benchmarks/run_benchmarks.py -latency 0.05 -token-latency 0.001 -compare bench.json
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_FOLDER)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_ollama import FakeOllamaServer
+from fixtures import generate_corpus
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_FOLDER, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def time_stage(func, runs):
+    """Median, min and max seconds of runs calls; the last return value is kept for the next stages."""
+    samples = []
+    value = None
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            value = func()
+            samples.append(time.perf_counter() - start)
+    except Exception as e:
+        print(f"Stage failed: {type(e).__name__}: {e}")
+        return {'error': f'{type(e).__name__}: {e}'}, None
+    return {
+        'runs': runs,
+        'median_seconds': statistics.median(samples),
+        'min_seconds': min(samples),
+        'max_seconds': max(samples),
+    }, value
+
+
+def run(args, work_folder):
+    # The backend is imported only now, with the working folder and Ollama host pointing at the sandbox
+    import llm_client
+    llm_client.OLLAMA_HOST = args.host
+    import app
+    import ai_processing
+    import extractors
+    import pdf_generator
+
+    pdf_generator.INVOICE_FOLDER = os.path.join(work_folder, 'invoices')
+    os.makedirs(pdf_generator.INVOICE_FOLDER, exist_ok=True)
+    corpus = generate_corpus(os.path.join(work_folder, 'fixtures'), args.pages, args.rows)
+
+    stages = {}
+    texts = {}
+    for extension in ('.pdf', '.docx', '.png', '.xlsx', '.xls'):
+        extract = extractors.get_extractor(extractors.mime_type_of(extension))
+        name = extract.__name__
+        if extension not in corpus:
+            stages[name] = {'error': 'fixture not available'}
+            continue
+        stages[name], texts[extension] = time_stage(lambda: extract(corpus[extension]), args.runs)
+
+    contract_text = texts.get('.pdf') or texts.get('.docx') or ''
+    processed = None
+    for engine in ai_processing.EXTRACTION_ENGINES:
+        stages[f'process_contract[{engine}]'], result = time_stage(lambda: ai_processing.process_contract(contract_text, engine=engine), args.runs)
+        processed = processed or result
+
+    if processed is not None:
+        stages['generate_invoice_from_text'], _ = time_stage(lambda: pdf_generator.generate_invoice_from_text(processed, 'benchmark'), args.runs)
+        stages['render_invoice_from_text'], _ = time_stage(lambda: pdf_generator.render_invoice_from_text(processed), args.runs)
+        invoice_json = pdf_generator.generate_invoice_json(processed)
+        stages['generate_invoice_from_json'], _ = time_stage(lambda: pdf_generator.generate_invoice_from_json(invoice_json, 'benchmark'), args.runs)
+        stages['render_invoice_from_json'], _ = time_stage(lambda: pdf_generator.render_invoice_from_json(invoice_json), args.runs)
+    return stages
+
+
+def print_stages(stages, previous=None):
+    print(f"{'stage':<38}{'median s':>10}{'min s':>10}{'max s':>10}{'vs prev':>10}")
+    for name, stage in stages.items():
+        if 'error' in stage:
+            print(f"{name:<38}  {stage['error']}")
+            continue
+        change = ''
+        before = (previous or {}).get(name, {})
+        if before.get('median_seconds'):
+            change = f"{(stage['median_seconds'] / before['median_seconds'] - 1) * 100:+.0f}%"
+        print(f"{name:<38}{stage['median_seconds']:>10.4f}{stage['min_seconds']:>10.4f}{stage['max_seconds']:>10.4f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage against a stand-in Ollama server.")
+    parser.add_argument('-runs', type=int, default=3, help="Runs per stage")
+    parser.add_argument('-pages', type=int, default=5, help="Pages of the PDF and DOCX fixtures (above ~6 pages the main prompt is chunked)")
+    parser.add_argument('-rows', type=int, default=5000, help="Rows of the XLSX and XLS fixtures")
+    parser.add_argument('-latency', type=float, default=0.0, help="Fake LLM: fixed seconds per call")
+    parser.add_argument('-token-latency', type=float, default=0.0, help="Fake LLM: seconds per generated token")
+    parser.add_argument('-prefill-latency', type=float, default=0.0, help="Fake LLM: seconds per prompt token")
+    parser.add_argument('-prefix-cache-slots', type=int, default=0, help="Fake LLM: prompts cached per model for prefix reuse")
+    parser.add_argument('-output', type=str, default='benchmark_results.json', help="JSON file for the results")
+    parser.add_argument('-compare', type=str, help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            previous = json.load(file)['stages']
+
+    server = FakeOllamaServer(latency=args.latency, token_latency=args.token_latency, prefill_latency=args.prefill_latency,
+                              prefix_cache_slots=args.prefix_cache_slots).start()
+    args.host = server.url
+
+    # Uploads, text files, cache and invoices of this run stay in a throwaway folder
+    work_folder = tempfile.mkdtemp(prefix='contract-bench-')
+    os.chdir(work_folder)
+    stages = run(args, work_folder)
+    server.shutdown()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'host')},
+        'llm_requests': server.requests,
+        'stages': stages,
+    }
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    print_stages(stages, previous)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import re
+
+# Rough number of characters per model token, used to estimate prompt sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# Lines that open a new section of a contract: "1. Obiectul contractului", "Article 4", "ANEXA NR. 2", all-caps titles.
+# Numbered sub-clauses ("2.3 The Provider shall...") are paragraphs, not sections.
+NUMBERED_HEADING = re.compile(r'^\d+\.?\s+\S')
+KEYWORD_HEADING = re.compile(r'^\s*(article|articolul|art\.|section|sectiunea|secțiunea|chapter|capitolul|annex|anexa)\b', re.IGNORECASE)
+
+# Headings are short; longer lines are clauses
+MAX_HEADING_CHARS = 100
+
+# A chunk that is at least this full is closed early when a section heading comes next
+SECTION_BREAK_FILL = 0.6
+
+
+def estimate_tokens(text):
+    """Approximate token count of a text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def is_heading(line):
+    stripped = line.strip()
+    if not stripped:
+        return False
+    if len(stripped) > MAX_HEADING_CHARS:
+        return False
+    if NUMBERED_HEADING.match(stripped) or KEYWORD_HEADING.match(stripped):
+        return True
+    return len(stripped) > 3 and stripped.isupper()
+
+
+def split_segments(text):
+    """Split text into paragraphs and sections, keeping every character so chunks join back to the text.
+
+    Returns (segment, starts_section) pairs.
+    """
+    segments = []
+    current = []
+    current_is_section = False
+    for line in text.splitlines(keepends=True):
+        heading = is_heading(line)
+        if current and (heading or not line.strip()):
+            segments.append((''.join(current), current_is_section))
+            current = []
+        if not current:
+            current_is_section = heading
+        current.append(line)
+    if current:
+        segments.append((''.join(current), current_is_section))
+    return segments
+
+
+def split_oversized(segment, max_chars):
+    """Split a segment longer than a whole chunk on line boundaries, and on characters as a last resort."""
+    pieces = []
+    current = ''
+    for line in segment.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars and current:
+            pieces.append(current)
+            current = ''
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_into_chunks(text, chunk_tokens, overlap_tokens):
+    """Split text into chunks of about chunk_tokens, on section and paragraph boundaries.
+
+    Each chunk starts with the last paragraphs of the previous chunk, up to overlap_tokens, so clauses
+    cut by a boundary are seen whole at least once.
+    """
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    overlap_chars = overlap_tokens * CHARS_PER_TOKEN
+
+    segments = []
+    for segment, starts_section in split_segments(text):
+        if len(segment) > max_chars:
+            pieces = split_oversized(segment, max_chars)
+            segments.append((pieces[0], starts_section))
+            segments.extend((piece, False) for piece in pieces[1:])
+        else:
+            segments.append((segment, starts_section))
+
+    chunks = []
+    current = []
+    current_chars = 0
+    for segment, starts_section in segments:
+        full = current_chars + len(segment) > max_chars
+        section_break = starts_section and current_chars >= SECTION_BREAK_FILL * max_chars
+        if current and (full or section_break):
+            chunks.append(''.join(current))
+            # Carry the tail of the finished chunk over as overlap
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) > overlap_chars or overlap_size + len(previous) + len(segment) > max_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous)
+            current = overlap
+            current_chars = overlap_size
+        current.append(segment)
+        current_chars += len(segment)
+    if current:
+        chunks.append(''.join(current))
+    return chunks
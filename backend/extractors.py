@@ -0,0 +1,63 @@
+import importlib
+import threading
+import time
+
+import metrics
+
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+XLS_TYPE = 'application/vnd.ms-excel'
+
+# Text extractor of each supported MIME type, as (module, function). A module, and the parsing library it
+# wraps (PyPDF2, python-docx, PIL and pytesseract, openpyxl, xlrd), is only imported when the first file
+# of its type arrives, so workers start without them and only carry the ones they use.
+EXTRACTORS = {
+    'application/pdf': ('pdf_extraction', 'extract_text_from_pdf'),
+    DOCX_TYPE: ('word_extraction', 'extract_text_from_word'),
+    'image/jpeg': ('ocr', 'extract_text_from_image'),
+    'image/png': ('ocr', 'extract_text_from_image'),
+    'image/tiff': ('ocr', 'extract_text_from_image'),
+    XLSX_TYPE: ('spreadsheet_extraction', 'extract_text_from_excel'),
+    XLS_TYPE: ('spreadsheet_extraction', 'extract_text_from_xls'),
+}
+
+# MIME type of each supported file extension; uploads are sniffed into one of these extensions
+EXTENSION_TYPES = {
+    '.pdf': 'application/pdf',
+    '.docx': DOCX_TYPE,
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.tif': 'image/tiff',
+    '.tiff': 'image/tiff',
+    '.xlsx': XLSX_TYPE,
+    '.xls': XLS_TYPE,
+}
+
+loaded_extractors = {}
+extractors_lock = threading.Lock()
+
+
+def mime_type_of(file_ext):
+    """MIME type of a file extension such as '.pdf', or None if the format is not supported."""
+    return EXTENSION_TYPES.get(file_ext.lower())
+
+
+def get_extractor(mime_type):
+    """Extractor callable of a MIME type, importing its module on first use."""
+    with extractors_lock:
+        extractor = loaded_extractors.get(mime_type)
+        if extractor is None:
+            if mime_type not in EXTRACTORS:
+                raise ValueError(f'Unsupported file type: {mime_type}')
+            module_name, function_name = EXTRACTORS[mime_type]
+            start = time.perf_counter()
+            extractor = getattr(importlib.import_module(module_name), function_name)
+            metrics.observe('extractor_import_seconds', time.perf_counter() - start, module=module_name)
+            loaded_extractors[mime_type] = extractor
+        return extractor
+
+
+def extract_text(source, mime_type):
+    """Text of a path or binary file object of the given MIME type."""
+    return get_extractor(mime_type)(source)
@@ -0,0 +1,34 @@
+# Production server configuration, in place of the Flask development server.
+#
+# Usage (from the backend folder):
+#   gunicorn -c gunicorn.conf.py app:app
+#
+# The job queue, result cache memory tier, memory invoice store, leases and metrics live in the process,
+# so the app runs as ONE worker process; concurrency comes from its threads. Admission control is the job
+# queue's (MAX_INFLIGHT_CONVERSIONS, MAX_QUEUED_CONVERSIONS, MAX_QUEUE_WAIT_SECONDS): a saturated backend
+# answers 429 with Retry-After instead of piling more calls onto Ollama. To scale out, run more instances
+# behind a load balancer with INVOICE_STORE=s3.
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+
+# One process (see above), threaded for uploads, polling and the long-lived event streams
+workers = 1
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+
+# Requests waiting for a free thread; beyond this the kernel refuses connections
+backlog = 256
+
+# The gthread worker heartbeats independently of requests, so event streams may stay open past this
+timeout = 120
+graceful_timeout = 60
+keepalive = 5
+
+# The app starts background threads (job workers, retention daemon, model warm-up) at import, which do
+# not survive a fork: load it in the worker, never in the master
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
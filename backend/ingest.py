@@ -0,0 +1,141 @@
+import io
+import struct
+import zipfile
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+# Uploads up to this size stay in memory; bigger ones spill over to an anonymous temporary file
+UPLOAD_SPOOL_BYTES = 8 * 1024 * 1024
+
+# Largest request accepted by /api/convert-contract; bigger ones are refused with 413 before being read
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+# Largest request accepted by /api/convert-batch
+MAX_BATCH_UPLOAD_BYTES = 1024 * 1024 * 1024
+
+# Leading bytes of each supported format; ZIP containers are told apart by their members
+MAGIC_NUMBERS = [
+    (b'%PDF-', '.pdf'),
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'II*\x00', '.tif'),
+    (b'MM\x00*', '.tif'),
+]
+ZIP_MAGIC = b'PK\x03\x04'
+ZIP_MEMBERS = [
+    ('word/document.xml', '.docx'),
+    ('xl/workbook.xml', '.xlsx'),
+]
+
+# OLE2 compound files hold .doc, .ppt and .msg as well as .xls; only those with a workbook stream are .xls
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+OLE2_WORKBOOK_STREAMS = {'Workbook', 'Book'}
+# Directory sectors read before giving up; the workbook stream is a top-level entry near the start
+OLE2_MAX_DIRECTORY_SECTORS = 64
+OLE2_END_OF_CHAIN = 0xFFFFFFFA
+
+# Some PDF writers put a few bytes of garbage before the header; readers accept it within the first KB
+PDF_HEADER_WINDOW = 1024
+
+
+class SpooledRequest(Request):
+    """Flask request whose uploaded files are spooled in memory up to UPLOAD_SPOOL_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
+
+def ole2_stream_names(stream):
+    """Names of the streams in the directory of an OLE2 compound file, read without parsing the streams.
+
+    Follows the directory chain through the FAT sectors listed in the header, which cover the first
+    few MB of the file; entries beyond that are not read.
+    """
+    stream.seek(0)
+    header = stream.read(512)
+    if len(header) < 512:
+        return set()
+    sector_shift, = struct.unpack_from('<H', header, 30)
+    fat_sector_count, first_directory_sector = struct.unpack_from('<II', header, 44)
+    if not 9 <= sector_shift <= 16:
+        return set()
+    sector_size = 1 << sector_shift
+    fat_sectors = [sector for sector in struct.unpack_from('<109I', header, 76)[:fat_sector_count] if sector < OLE2_END_OF_CHAIN]
+    entries_per_fat_sector = sector_size // 4
+
+    def read_sector(sector):
+        stream.seek((sector + 1) * sector_size)
+        return stream.read(sector_size)
+
+    def next_sector(sector):
+        index, offset = divmod(sector, entries_per_fat_sector)
+        if index >= len(fat_sectors):
+            return OLE2_END_OF_CHAIN
+        data = read_sector(fat_sectors[index])
+        if len(data) < (offset + 1) * 4:
+            return OLE2_END_OF_CHAIN
+        return struct.unpack_from('<I', data, offset * 4)[0]
+
+    names = set()
+    sector = first_directory_sector
+    for _ in range(OLE2_MAX_DIRECTORY_SECTORS):
+        if sector >= OLE2_END_OF_CHAIN:
+            break
+        data = read_sector(sector)
+        for start in range(0, len(data) - 127, 128):
+            name_length, entry_type = struct.unpack_from('<HB', data, start + 64)
+            # Entry type 2 is a stream; the name length counts the UTF-16 terminator
+            if entry_type == 2 and 2 <= name_length <= 64:
+                names.add(data[start:start + name_length - 2].decode('utf-16-le', errors='replace'))
+        sector = next_sector(sector)
+    return names
+
+
+def sniff_format(stream):
+    """Format of an upload from its content, as the extension of its parser ('.pdf', '.docx', ...), or None.
+
+    The stream is left at position 0.
+    """
+    stream.seek(0)
+    head = stream.read(PDF_HEADER_WINDOW)
+    stream.seek(0)
+
+    for magic, file_format in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return file_format
+    if head.startswith(OLE2_MAGIC):
+        try:
+            names = ole2_stream_names(stream)
+        finally:
+            stream.seek(0)
+        return '.xls' if names & OLE2_WORKBOOK_STREAMS else None
+    if head.startswith(ZIP_MAGIC):
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                names = set(archive.namelist())
+        except zipfile.BadZipFile:
+            return None
+        finally:
+            stream.seek(0)
+        for member, file_format in ZIP_MEMBERS:
+            if member in names:
+                return file_format
+        return None
+    if b'%PDF-' in head:
+        return '.pdf'
+    return None
+
+
+def sniff_file(path):
+    with open(path, 'rb') as file:
+        return sniff_format(file)
+
+
+def detach_upload(file):
+    """Take the spooled stream out of a werkzeug FileStorage, so it outlives the request for a background job."""
+    stream = file.stream
+    # Flask closes the request's files when the request ends
+    file.stream = io.BytesIO()
+    stream.seek(0)
+    return stream
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Where generated invoices and batch archives are kept:
+#   'folder' - files in INVOICE_FOLDER, shared by every worker that mounts the same disk
+#   'memory' - in-process LRU, no disk I/O; only for a single backend process
+#   's3'     - an S3-compatible bucket (needs boto3), for backends scaled over several hosts
+INVOICE_STORE = os.environ.get('INVOICE_STORE', 'folder')
+
+INVOICE_FOLDER = './invoices'
+
+# Bytes of PDFs kept by the memory store before the least recently used ones are dropped
+MEMORY_STORE_MAX_BYTES = 256 * 1024 * 1024
+
+# Bucket, key prefix and optional endpoint (e.g. MinIO) of the S3 store
+S3_BUCKET = os.environ.get('INVOICE_STORE_BUCKET', '')
+S3_PREFIX = os.environ.get('INVOICE_STORE_PREFIX', 'invoices/')
+S3_ENDPOINT_URL = os.environ.get('INVOICE_STORE_ENDPOINT_URL') or None
+
+invoice_store = None
+store_lock = threading.Lock()
+
+
+def content_etag(data):
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class FolderStore:
+    """Blobs as files in a folder; writes go to a temporary name first, so readers never see half a PDF."""
+
+    def __init__(self, folder=INVOICE_FOLDER):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def put(self, name, data):
+        path = os.path.join(self.folder, name)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        return content_etag(data)
+
+    def get(self, name):
+        """(data, etag), or None if there is no blob of that name."""
+        try:
+            with open(os.path.join(self.folder, name), 'rb') as file:
+                data = file.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        return data, content_etag(data)
+
+
+class MemoryStore:
+    """Blobs in an in-process LRU bounded by max_bytes; nothing touches the disk."""
+
+    def __init__(self, max_bytes=MEMORY_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.blobs = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def put(self, name, data):
+        etag = content_etag(data)
+        with self.lock:
+            previous = self.blobs.pop(name, None)
+            if previous is not None:
+                self.size -= len(previous[0])
+            self.blobs[name] = (data, etag, time.time())
+            self.size += len(data)
+            while self.size > self.max_bytes and len(self.blobs) > 1:
+                _, (evicted, _, _) = self.blobs.popitem(last=False)
+                self.size -= len(evicted)
+        return etag
+
+    def get(self, name):
+        with self.lock:
+            blob = self.blobs.get(name)
+            if blob is None:
+                return None
+            self.blobs.move_to_end(name)
+            return blob[0], blob[1]
+
+
+class S3Store:
+    """Blobs in an S3-compatible bucket, so any backend host can serve any invoice."""
+
+    def __init__(self, bucket=S3_BUCKET, prefix=S3_PREFIX, endpoint_url=S3_ENDPOINT_URL):
+        # boto3 is only needed when this store is configured
+        import boto3
+        if not bucket:
+            raise ValueError('INVOICE_STORE_BUCKET must be set for the s3 invoice store')
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def put(self, name, data):
+        etag = content_etag(data)
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data, Metadata={'sha256': etag})
+        return etag
+
+    def get(self, name):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        data = response['Body'].read()
+        return data, response.get('Metadata', {}).get('sha256') or content_etag(data)
+
+
+STORES = {
+    'folder': FolderStore,
+    'memory': MemoryStore,
+    's3': S3Store,
+}
+
+
+def get_invoice_store():
+    """Store selected by INVOICE_STORE, created on first use."""
+    global invoice_store
+    with store_lock:
+        if invoice_store is None:
+            if INVOICE_STORE not in STORES:
+                raise ValueError(f'Unknown invoice store: {INVOICE_STORE}')
+            invoice_store = STORES[INVOICE_STORE]()
+        return invoice_store
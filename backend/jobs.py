@@ -0,0 +1,357 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+
+import metrics
+
+# Number of conversions in flight at the same time; the rest wait in the queue. Every job takes one worker
+# slot per conversion it runs at a time, so a batch converting two files at once takes two.
+JOB_WORKERS = int(os.environ.get('MAX_INFLIGHT_CONVERSIONS', 2))
+
+# Maximum number of jobs waiting for a worker before new submissions are refused
+MAX_QUEUED_JOBS = int(os.environ.get('MAX_QUEUED_CONVERSIONS', 20))
+
+# Submissions whose estimated wait for a worker is longer than this are refused too, so the jobs that are
+# admitted start within a predictable time instead of piling up until their clients give up
+MAX_QUEUE_WAIT_SECONDS = int(os.environ.get('MAX_QUEUE_WAIT_SECONDS', 300))
+
+# Job priorities, most urgent first. A job waits behind every queued job of its own or a more urgent
+# priority, and may only be queued while the queue is less full than its share, so a burst of batch work
+# leaves room for interactive uploads.
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+PRIORITY_QUEUE_SHARE = {'high': 1.0, 'normal': 0.75, 'low': 0.5}
+
+# Duration assumed for a job before any has finished, and weight of each new duration in the running average.
+# Durations are averaged per kind of job and per unit of work (a single upload, or one file of a batch), so
+# one long batch does not make every single upload look long.
+JOB_KINDS = ('single', 'batch')
+
+# Worker slots batch jobs can never take, so single uploads of any priority start while batches run
+# (with a single worker there is nothing to reserve, and batches and uploads take turns)
+RESERVED_SINGLE_SLOTS = int(os.environ.get('RESERVED_SINGLE_SLOTS', 1))
+INITIAL_JOB_SECONDS = 60
+JOB_SECONDS_SMOOTHING = 0.2
+
+# Finished jobs are forgotten after this many seconds
+JOB_RETENTION_SECONDS = 3600
+
+# Seconds between keep-alive heartbeats on an idle event stream
+EVENT_HEARTBEAT_SECONDS = 15
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is refused because the queue is full or its wait would be too long.
+
+    retry_after is the number of seconds after which a new submission is likely to be admitted.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once a client has asked for it to be cancelled."""
+
+
+class JobQueue:
+    """Fixed pool of workers running jobs in the background, with a bounded priority queue in front of it,
+    that keeps the state and events of every job for clients.
+
+    Submitted functions receive a progress(event, data) keyword argument. Every call is appended to the
+    job's event log, which clients can follow with iter_events(). Calling progress() after cancel() raises
+    JobCancelled, so the job stops at its next stage or token. An optional on_finish() callback runs once the
+    job is over, whether it ran, failed or was cancelled before starting.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS, max_wait=MAX_QUEUE_WAIT_SECONDS,
+                 retention=JOB_RETENTION_SECONDS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.retention = retention
+        self.jobs = {}
+        self.waiting = []
+        self.order = itertools.count()
+        self.average_seconds = {kind: INITIAL_JOB_SECONDS for kind in JOB_KINDS}
+        # Slots batch jobs may hold together
+        self.batch_slots = max(1, workers - RESERVED_SINGLE_SLOTS)
+        self.busy_slots = 0
+        self.busy_batch_slots = 0
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.threads = []
+
+    def start(self):
+        if not self.threads:
+            self.threads = [threading.Thread(target=self.work, name=f'job-{index}', daemon=True) for index in range(self.workers)]
+            for thread in self.threads:
+                thread.start()
+        return self
+
+    def expected_seconds(self, job):
+        return self.average_seconds[job['kind']] * job['units'] / job['slots']
+
+    def estimate_wait(self, priority, slots, kind='single'):
+        """Seconds until a new job of this priority gets its worker slots, from the remaining time of the
+        running jobs and the expected duration of the queued jobs ahead of it. Caller holds the lock."""
+        now = time.time()
+        # Seconds from now at which each worker slot becomes free; batch jobs only use the first batch_slots
+        free_at = [0.0] * self.workers
+
+        def earliest(kind, slots):
+            candidates = range(self.batch_slots) if kind == 'batch' else range(self.workers)
+            return sorted(candidates, key=lambda index: free_at[index])[:slots]
+
+        def occupy(job, start, seconds):
+            indexes = earliest(job['kind'], job['slots'])
+            if start is None:
+                start = max(free_at[index] for index in indexes)
+            for index in indexes:
+                free_at[index] = start + seconds
+
+        running = [job for job in self.jobs.values() if job['state'] == RUNNING]
+        for job in sorted(running, key=lambda job: job['kind'] != 'batch'):
+            occupy(job, 0.0, max(0.0, self.expected_seconds(job) - (now - job['started'])))
+        # Jobs start in queue order, each as soon as enough slots it may use are free
+        for entry in sorted(self.waiting):
+            job = self.jobs.get(entry[2])
+            if job is None or job['cancel_requested'] or PRIORITIES[job['priority']] > PRIORITIES[priority]:
+                continue
+            occupy(job, None, self.expected_seconds(job))
+        return max(free_at[index] for index in earliest(kind, slots))
+
+    def admission(self, priority, slots=1, kind='single'):
+        """Raise QueueFullError if a job of this priority and size would be refused now. Caller holds the lock."""
+        queued = [job for job in self.jobs.values() if job['state'] == QUEUED and not job['cancel_requested']]
+        limit = math.ceil(self.max_queued * PRIORITY_QUEUE_SHARE[priority])
+        wait = self.estimate_wait(priority, slots, kind)
+        if len(queued) >= limit:
+            reason, message = 'queue_full', f'{len(queued)} jobs are already queued'
+        elif wait > self.max_wait:
+            reason, message = 'wait_too_long', f'estimated wait of {wait:.0f}s for a worker'
+        else:
+            return
+        metrics.inc('job_admission_rejections_total', priority=priority, reason=reason)
+        retry_after = max(1, math.ceil(max(wait - self.max_wait, self.average_seconds['single'] / self.workers)))
+        raise QueueFullError(message, retry_after)
+
+    def check_admission(self, priority='normal', slots=1, kind='single'):
+        """Raise QueueFullError now if a job of this priority would be refused, e.g. before reading an upload."""
+        with self.lock:
+            self.admission(priority, self.slots_for(kind, slots), kind)
+
+    def slots_for(self, kind, slots):
+        """Slots a job of this kind asking for this many is given: at least one, and batches stay out of
+        the reserved ones."""
+        return max(1, min(slots, self.batch_slots if kind == 'batch' else self.workers))
+
+    def submit(self, func, *args, priority='normal', kind='single', slots=1, units=1, on_finish=None, **kwargs):
+        """Queue func(*args, progress=..., **kwargs) and return the job id.
+
+        kind and units (the number of files of a batch) select the running average of the job's duration;
+        slots is the number of worker slots it asks for while it runs; see slots_for() for what it gets.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unknown priority: {priority}')
+        if kind not in JOB_KINDS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        slots = self.slots_for(kind, slots)
+        with self.changed:
+            self.prune()
+            self.admission(priority, slots, kind)
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {
+                'id': job_id,
+                'state': QUEUED,
+                'priority': priority,
+                'kind': kind,
+                'slots': slots,
+                'units': max(1, units),
+                'created': time.time(),
+                'started': None,
+                'finished': None,
+                'result': None,
+                'error': None,
+                'cancel_requested': False,
+                'events': [],
+            }
+            heapq.heappush(self.waiting, (PRIORITIES[priority], next(self.order), job_id, slots, func, args, kwargs, on_finish))
+            self.changed.notify_all()
+        return job_id
+
+    def next_entry(self):
+        """Index in self.waiting of the job to start now, or None. Caller holds the lock.
+
+        The most urgent job starts once enough slots are free; the jobs behind it wait, so a batch is not
+        starved by single uploads taking every slot that frees up. A batch waiting only because the other
+        batches hold all of batch_slots is passed over instead, so the reserved slots stay usable.
+        """
+        for index, entry in sorted(enumerate(self.waiting), key=lambda item: item[1][:2]):
+            slots = entry[3]
+            job = self.jobs.get(entry[2])
+            if job is not None and job['kind'] == 'batch' and self.busy_batch_slots + slots > self.batch_slots:
+                continue
+            return index if slots <= self.workers - self.busy_slots else None
+        return None
+
+    def work(self):
+        while True:
+            with self.changed:
+                index = self.next_entry()
+                while index is None:
+                    self.changed.wait()
+                    index = self.next_entry()
+                _, _, job_id, slots, func, args, kwargs, on_finish = self.waiting.pop(index)
+                heapq.heapify(self.waiting)
+                job = self.jobs.get(job_id)
+                batch_slots = slots if job is not None and job['kind'] == 'batch' else 0
+                self.busy_slots += slots
+                self.busy_batch_slots += batch_slots
+                if job is not None:
+                    metrics.observe('job_queue_wait_seconds', time.time() - job['created'], priority=job['priority'])
+            try:
+                self.run(job_id, func, args, kwargs, on_finish)
+            finally:
+                with self.changed:
+                    self.busy_slots -= slots
+                    self.busy_batch_slots -= batch_slots
+                    self.changed.notify_all()
+
+    def run(self, job_id, func, args, kwargs, on_finish=None):
+        def progress(event, data=None):
+            self.publish(job_id, event, data)
+
+        started = time.time()
+        try:
+            # A job cancelled while still queued never starts
+            self.update(job_id, state=RUNNING, started=started)
+            result = func(*args, progress=progress, **kwargs)
+        except JobCancelled:
+            self.finish(job_id, CANCELLED, 'cancelled', {})
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            self.finish(job_id, FAILED, 'failed', {'error': str(e)}, error=str(e))
+        else:
+            self.finish(job_id, DONE, 'done', result, result=result)
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    # Seconds per unit of work on one slot, e.g. per batch file
+                    seconds = (time.time() - started) * job['slots'] / job['units']
+                    self.average_seconds[job['kind']] += JOB_SECONDS_SMOOTHING * (seconds - self.average_seconds[job['kind']])
+        finally:
+            if on_finish is not None:
+                on_finish()
+
+    def update(self, job_id, **fields):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            if job['cancel_requested']:
+                raise JobCancelled()
+            job.update(fields)
+            self.changed.notify_all()
+
+    def publish(self, job_id, event, data=None):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            if job['cancel_requested']:
+                raise JobCancelled()
+            job['events'].append({'event': event, 'data': data if data is not None else {}})
+            self.changed.notify_all()
+
+    def finish(self, job_id, state, event, data, **fields):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields, state=state, finished=time.time())
+            job['events'].append({'event': event, 'data': data})
+            self.changed.notify_all()
+
+    def cancel(self, job_id):
+        """Ask a queued or running job to stop; returns False if the job is unknown or already finished."""
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None or job['state'] in FINISHED_STATES:
+                return False
+            job['cancel_requested'] = True
+            self.changed.notify_all()
+            return True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            job['events'] = len(job['events'])
+            return job
+
+    def get_stats(self):
+        """Queue depth by priority, jobs running and the average job duration used for admission."""
+        with self.lock:
+            queued = {priority: 0 for priority in PRIORITIES}
+            for job in self.jobs.values():
+                if job['state'] == QUEUED and not job['cancel_requested']:
+                    queued[job['priority']] += 1
+            return {
+                'workers': self.workers,
+                'running': sum(1 for job in self.jobs.values() if job['state'] == RUNNING),
+                'busySlots': self.busy_slots,
+                'batchSlots': self.batch_slots,
+                'queued': queued,
+                'maxQueued': self.max_queued,
+                'maxWaitSeconds': self.max_wait,
+                'averageJobSeconds': {kind: round(seconds, 1) for kind, seconds in self.average_seconds.items()},
+            }
+
+    def count_by_state(self):
+        with self.lock:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self.jobs.values():
+                counts[job['state']] += 1
+            return counts
+
+    def iter_events(self, job_id, start=0, heartbeat=EVENT_HEARTBEAT_SECONDS):
+        """Yield (index, event) pairs from start until the job finishes; yields None on idle heartbeats."""
+        index = start
+        while True:
+            with self.changed:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    return
+                if index >= len(job['events']) and job['state'] not in FINISHED_STATES:
+                    self.changed.wait(heartbeat)
+                events = job['events'][index:]
+                finished = job['state'] in FINISHED_STATES
+            if not events:
+                if finished:
+                    return
+                yield None
+                continue
+            for event in events:
+                yield index, event
+                index += 1
+
+    def prune(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self.jobs.items() if job['finished'] and job['finished'] < cutoff]:
+            del self.jobs[job_id]
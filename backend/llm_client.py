@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+import httpx
+import ollama
+import metrics
+from chunking import estimate_tokens
+
+# Ollama server used by every LLM call
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434')
+
+# Seconds to wait for a connection, and for the model to answer a single call
+OLLAMA_CONNECT_TIMEOUT_SECONDS = 10
+OLLAMA_READ_TIMEOUT_SECONDS = 600
+
+# Size of the HTTP connection pool shared by all threads (job workers, secondary prompts, chunks)
+OLLAMA_MAX_CONNECTIONS = 16
+
+# How long Ollama keeps a model in memory after a call; sent with every request
+KEEP_ALIVE = '30m'
+
+# Context window models are warmed up with. From then on each model's context is sized from its prompts:
+# a call that does not fit grows it to the next power of two, up to MAX_NUM_CTX, and the keep-alive ping
+# shrinks it back, not below MIN_NUM_CTX, to what the calls of the last interval needed. Ollama reloads a
+# model whose num_ctx changes and drops its cached prompt prefixes, so a call that fits is sent with the
+# model's current context rather than its own exact size.
+NUM_CTX = int(os.environ.get('OLLAMA_NUM_CTX', 8192))
+MIN_NUM_CTX = int(os.environ.get('OLLAMA_MIN_NUM_CTX', 2048))
+MAX_NUM_CTX = int(os.environ.get('OLLAMA_MAX_NUM_CTX', 32768))
+
+# Prompt size estimate: chat-template tokens added per message, and a margin on the characters-per-token guess
+TEMPLATE_TOKENS_PER_MESSAGE = 8
+ESTIMATE_MARGIN = 1.1
+
+# Output tokens reserved in the context for calls that do not cap num_predict themselves
+DEFAULT_NUM_PREDICT = 2048
+
+# Seconds between keep-alive pings that stop idle models from being unloaded
+KEEP_ALIVE_INTERVAL_SECONDS = 300
+
+client = None
+client_lock = threading.Lock()
+
+# Context each model is loaded with, and the largest context its calls needed since the last keep-alive ping
+context_sizes = {}
+context_demand = {}
+context_lock = threading.Lock()
+
+# LLM errors that mean the server or model is unavailable
+LLM_ERRORS = (ollama.ResponseError, httpx.HTTPError, ConnectionError)
+
+# Models that finished warming up, and the models the keep-alive thread keeps resident
+ready_models = set()
+resident_models = []
+keep_alive_thread = None
+
+
+def get_client():
+    """The shared Ollama client; its httpx connection pool is reused across calls and threads."""
+    global client
+    with client_lock:
+        if client is None:
+            client = ollama.Client(
+                host=OLLAMA_HOST,
+                timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT_SECONDS, connect=OLLAMA_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+            )
+        return client
+
+
+def estimate_prompt_tokens(messages):
+    """Approximate token count of chat messages as the model sees them."""
+    tokens = sum(estimate_tokens(message.get('content', '')) + TEMPLATE_TOKENS_PER_MESSAGE for message in messages)
+    return int(tokens * ESTIMATE_MARGIN)
+
+
+def context_bucket(tokens):
+    size = MIN_NUM_CTX
+    while size < tokens and size < MAX_NUM_CTX:
+        size *= 2
+    return min(size, MAX_NUM_CTX)
+
+
+def context_for(model, needed):
+    """num_ctx for a call to model that needs this many tokens: the model's current context when the call
+    fits, else the next bucket up, which makes Ollama reload the model."""
+    bucket = context_bucket(needed)
+    with context_lock:
+        context_demand[model] = max(context_demand.get(model, 0), bucket)
+        current = context_sizes.get(model, NUM_CTX)
+        if bucket > current:
+            print(f"Growing the context of {model} from {current} to {bucket} tokens")
+            metrics.inc('llm_context_resizes_total', model=model, direction='grow')
+            current = bucket
+        context_sizes[model] = current
+        return current
+
+
+def shrink_context(model):
+    # Only after an interval with calls: an idle model keeps its context, so the next call does not reload it
+    with context_lock:
+        demand = context_demand.pop(model, None)
+        current = context_sizes.get(model, NUM_CTX)
+        if demand is None or demand >= current:
+            return
+        print(f"Shrinking the context of {model} from {current} to {demand} tokens")
+        metrics.inc('llm_context_resizes_total', model=model, direction='shrink')
+        context_sizes[model] = demand
+
+
+def model_options(section, model, messages, options=None):
+    """Options of a call with num_ctx sized from its prompt and output cap; logs prompts that will not fit."""
+    options = dict(options or {})
+    prompt_tokens = estimate_prompt_tokens(messages)
+    output_tokens = options.get('num_predict') or DEFAULT_NUM_PREDICT
+    options['num_ctx'] = context_for(model, prompt_tokens + output_tokens)
+    if prompt_tokens + output_tokens > options['num_ctx']:
+        # Ollama silently drops the start of a prompt that does not fit
+        print(f"Truncating {section} input: ~{prompt_tokens} prompt and {output_tokens} output tokens exceed "
+              f"the {options['num_ctx']}-token context of {model}")
+        metrics.inc('llm_truncated_prompts_total', section=section, model=model)
+    return options
+
+
+def chat(section='other', **kwargs):
+    """ollama.chat through the shared client, always with the same keep_alive, and with num_ctx sized to
+    the prompt, so models stay loaded and prompt prefixes stay cached.
+
+    Every call is recorded in the LLM metrics under its section name (main, chunk, merge, consolidated
+    or one of the secondary sections).
+    """
+    kwargs.setdefault('keep_alive', KEEP_ALIVE)
+    model = kwargs.get('model', '')
+    kwargs['options'] = model_options(section, model, kwargs.get('messages') or [], kwargs.get('options'))
+    start = time.perf_counter()
+    try:
+        response = get_client().chat(**kwargs)
+    except Exception:
+        metrics.inc('llm_calls_total', section=section, model=model, outcome='error')
+        raise
+    if kwargs.get('stream'):
+        return record_stream(response, section, model, start)
+    record_call(response, section, model, start)
+    return response
+
+
+def record_stream(chunks, section, model, start):
+    # The final chunk of a stream carries the token counts and durations of the whole call
+    try:
+        for chunk in chunks:
+            if chunk.get('done'):
+                record_call(chunk, section, model, start)
+            yield chunk
+    except Exception:
+        metrics.inc('llm_calls_total', section=section, model=model, outcome='error')
+        raise
+
+
+def record_call(response, section, model, start):
+    labels = {'section': section, 'model': model}
+    metrics.observe('llm_call_duration_seconds', time.perf_counter() - start, **labels)
+    metrics.inc('llm_calls_total', outcome='ok', **labels)
+    metrics.inc('llm_prompt_tokens_total', response.get('prompt_eval_count') or 0, **labels)
+    metrics.inc('llm_output_tokens_total', response.get('eval_count') or 0, **labels)
+    metrics.inc('llm_prompt_eval_seconds_total', (response.get('prompt_eval_duration') or 0) / 1e9, **labels)
+    metrics.inc('llm_eval_seconds_total', (response.get('eval_duration') or 0) / 1e9, **labels)
+    metrics.inc('llm_load_seconds_total', (response.get('load_duration') or 0) / 1e9, **labels)
+    # Calls priming a shared prompt prefix stop after one token on purpose
+    if response.get('done_reason') == 'length' and section != 'prefix':
+        print(f"{section} output of {model} was cut off at num_predict")
+        metrics.inc('llm_truncated_outputs_total', **labels)
+
+
+def warm_up(model):
+    """Load a model into memory with an empty request; returns True once the model is loaded."""
+    try:
+        start = time.perf_counter()
+        with context_lock:
+            num_ctx = context_sizes.setdefault(model, NUM_CTX)
+        get_client().generate(model=model, prompt='', keep_alive=KEEP_ALIVE, options={'num_ctx': num_ctx})
+    except LLM_ERRORS as e:
+        print(f"Warm-up of {model} failed: {e}")
+        ready_models.discard(model)
+        return False
+    if model not in ready_models:
+        print(f"Model {model} loaded in {time.perf_counter() - start:.1f}s")
+    ready_models.add(model)
+    return True
+
+
+def loaded_models():
+    """Names of the models the Ollama server currently holds in memory."""
+    try:
+        return [model['model'] for model in get_client().ps()['models']]
+    except LLM_ERRORS:
+        return []
+
+
+def keep_alive_loop():
+    while True:
+        time.sleep(KEEP_ALIVE_INTERVAL_SECONDS)
+        for model in list(resident_models):
+            shrink_context(model)
+            warm_up(model)
+
+
+def start(models):
+    """Warm up the models in the background and keep pinging them so they stay resident."""
+    global keep_alive_thread
+    for model in models:
+        if model not in resident_models:
+            resident_models.append(model)
+
+    def initial_warm_up():
+        for model in list(resident_models):
+            warm_up(model)
+
+    threading.Thread(target=initial_warm_up, name='llm-warm-up', daemon=True).start()
+    if keep_alive_thread is None:
+        keep_alive_thread = threading.Thread(target=keep_alive_loop, name='llm-keep-alive', daemon=True)
+        keep_alive_thread.start()
+
+
+def readiness():
+    """Readiness report: every resident model warmed up and still loaded on the server."""
+    loaded = loaded_models()
+    models = {}
+    for model in resident_models:
+        name = model if ':' in model else f'{model}:latest'
+        models[model] = {'warmedUp': model in ready_models, 'loaded': model in loaded or name in loaded}
+    ready = bool(models) and all(status['warmedUp'] and status['loaded'] for status in models.values())
+    return {'ready': ready, 'host': OLLAMA_HOST, 'models': models}
+
+
+# Context sizes as Ollama currently holds them, reported on every /metrics scrape
+metrics.register_gauge('llm_num_ctx', 'Context window each model is sized to, in tokens.', lambda: [
+    ({'model': model}, size) for model, size in list(context_sizes.items())
+])
@@ -0,0 +1,127 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets, in seconds, for stage and LLM call durations (uploads take milliseconds, LLM calls minutes)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+lock = threading.Lock()
+
+# name -> {'type', 'help', 'values'}; values maps a sorted tuple of label pairs to a number (or histogram state)
+registry = {}
+
+# Gauges computed on every scrape: name -> (help, function returning [(labels dict, value), ...])
+gauge_callbacks = {}
+
+
+def describe(name, metric_type, help_text):
+    with lock:
+        registry.setdefault(name, {'type': metric_type, 'help': help_text, 'values': {}})
+
+
+def label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Add value to a counter."""
+    with lock:
+        values = registry.setdefault(name, {'type': 'counter', 'help': '', 'values': {}})['values']
+        key = label_key(labels)
+        values[key] = values.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    with lock:
+        values = registry.setdefault(name, {'type': 'histogram', 'help': '', 'values': {}})['values']
+        key = label_key(labels)
+        state = values.get(key)
+        if state is None:
+            state = values[key] = {'buckets': [0] * len(DURATION_BUCKETS), 'count': 0, 'sum': 0.0}
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                state['buckets'][index] += 1
+        state['count'] += 1
+        state['sum'] += value
+
+
+def register_gauge(name, help_text, callback):
+    gauge_callbacks[name] = (help_text, callback)
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time a block of the request hot path as contract_stage_duration_seconds{stage=...}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('contract_stage_duration_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in pairs) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with lock:
+        for name, metric in sorted(registry.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric['values'].items()):
+                if metric['type'] != 'histogram':
+                    lines.append(f"{name}{format_labels(key)} {format_number(value)}")
+                    continue
+                for bound, count in zip(DURATION_BUCKETS, value['buckets']):
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', format_number(float(bound))),))} {count}")
+                lines.append(f"{name}_bucket{format_labels(key + (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{format_labels(key)} {format_number(value['sum'])}")
+                lines.append(f"{name}_count{format_labels(key)} {value['count']}")
+
+    for name, (help_text, callback) in sorted(gauge_callbacks.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in callback():
+            lines.append(f"{name}{format_labels(label_key(labels))} {format_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+describe('contract_stage_duration_seconds', 'histogram', 'Duration of request stages: upload sniff or save, text extraction by file type, PDF render, invoice store.')
+describe('llm_call_duration_seconds', 'histogram', 'Wall-clock duration of LLM calls, by section and model.')
+describe('llm_calls_total', 'counter', 'LLM calls, by section, model and outcome.')
+describe('llm_prompt_tokens_total', 'counter', 'Prompt tokens evaluated (prompt_eval_count), by section and model.')
+describe('llm_output_tokens_total', 'counter', 'Tokens generated (eval_count), by section and model.')
+describe('llm_prompt_eval_seconds_total', 'counter', 'Time spent on prefill (prompt_eval_duration), by section and model.')
+describe('llm_eval_seconds_total', 'counter', 'Time spent generating tokens (eval_duration), by section and model.')
+describe('llm_load_seconds_total', 'counter', 'Time spent loading the model (load_duration), by section and model.')
+describe('llm_model_fallbacks_total', 'counter', 'Secondary prompts retried on the main model after the section model returned invalid JSON.')
+describe('batch_files_total', 'counter', 'Files of batch uploads, by outcome (converted, failed, skipped).')
+describe('llm_calls_skipped_total', 'counter', 'Secondary prompts not sent because the rule-based pre-extraction covered the whole section.')
+describe('rule_corrections_total', 'counter', 'LLM field values replaced by rule-based values, by section and field.')
+describe('retention_deleted_files_total', 'counter', 'Files and batch folders deleted by the retention daemon, by folder.')
+describe('retention_reclaimed_bytes_total', 'counter', 'Bytes reclaimed by the retention daemon, by folder.')
+describe('section_json_repairs_total', 'counter', 'Section answers that needed repair (fences, trailing commas, truncation, missing fields) to match their schema.')
+describe('section_retries_total', 'counter', 'Secondary prompts re-issued because their answer could not be repaired, by section.')
+describe('section_parse_failures_total', 'counter', 'Sections still invalid after the retry budget was used up, by section.')
+describe('revision_sections_total', 'counter', 'Sections of revised contracts, by outcome: rerun after a relevant change, or reused from the previous version.')
+describe('llm_context_resizes_total', 'counter', 'Changes of the num_ctx of a model, each one reloading it in Ollama, by model and direction.')
+describe('llm_truncated_prompts_total', 'counter', 'Calls whose estimated prompt plus output cap exceeds the largest allowed context, by section and model.')
+describe('llm_truncated_outputs_total', 'counter', 'Calls whose output was cut off at num_predict, by section and model.')
+describe('job_admission_rejections_total', 'counter', 'Conversions refused with 429, by priority and reason (queue_full, wait_too_long).')
+describe('job_queue_wait_seconds', 'histogram', 'Time conversions waited in the queue before a worker started them, by priority.')
+describe('extractor_import_seconds', 'histogram', 'Time to import a text extractor module and its parsing library on first use, by module.')
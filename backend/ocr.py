@@ -0,0 +1,142 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps, ImageSequence
+import pytesseract
+
+# Resolution pages are scaled down to before OCR; tesseract gains nothing above ~300 DPI
+OCR_TARGET_DPI = 300
+
+# Longest side, in pixels, for images without DPI information (phone photos); an A4 page at 300 DPI
+OCR_MAX_SIDE = 3508
+
+# Binarize pages before OCR (Otsu threshold on the grayscale image)
+OCR_BINARIZE = True
+
+# Tesseract language(s), e.g. 'ron+eng'; None uses the tesseract default
+OCR_LANG = None
+
+# Number of worker processes used for multi-page images
+OCR_WORKERS = os.cpu_count() or 1
+
+# Images with at least this many pages are recognized over the process pool
+OCR_PARALLEL_MIN_PAGES = 2
+
+# Use a persistent in-process tesseract API (tesserocr) when it is installed, instead of
+# spawning a tesseract process for every page
+OCR_USE_TESSEROCR = True
+
+# Workers are started by a fork server (or spawned where there is none), never forked from the threaded server
+OCR_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+ocr_pool = None
+
+# tesserocr API instances are not thread-safe, so every thread keeps its own, keyed by language
+tesserocr_local = threading.local()
+
+
+def get_ocr_pool():
+    """Process pool shared by all requests, created on first use."""
+    global ocr_pool
+    if ocr_pool is None:
+        ocr_pool = ProcessPoolExecutor(max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context(OCR_POOL_START_METHOD))
+    return ocr_pool
+
+
+def otsu_threshold(image):
+    """Grayscale level that best separates ink from paper, computed from the histogram."""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background_count = 0
+    background_sum = 0
+    best_threshold = 127
+    best_variance = 0.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (weighted_total - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = level
+    return best_threshold
+
+
+def preprocess_page(image, target_dpi=OCR_TARGET_DPI, max_side=OCR_MAX_SIDE, binarize=OCR_BINARIZE):
+    """Downscale to the target DPI, convert to grayscale and binarize one page."""
+    dpi = image.info.get('dpi')
+    dpi = dpi[0] if isinstance(dpi, tuple) else 0
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('L')
+
+    if dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+    else:
+        scale = min(1.0, max_side / max(image.size))
+    if scale < 1.0:
+        # reducing_gap lets Pillow shrink by an integer factor first, which is much cheaper than a full LANCZOS pass
+        image = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.LANCZOS, reducing_gap=2.0)
+
+    if binarize:
+        threshold = otsu_threshold(image)
+        image = image.point(lambda level: 255 if level > threshold else 0)
+    return image
+
+
+def iter_pages(image):
+    """Every frame of a (possibly multi-page) image, e.g. a scanned TIFF."""
+    for frame in ImageSequence.Iterator(image):
+        page = frame.copy()
+        page.info = dict(image.info, **frame.info)
+        yield page
+
+
+def get_tesserocr_api(lang):
+    if not OCR_USE_TESSEROCR:
+        return None
+    apis = tesserocr_local.__dict__.setdefault('apis', {})
+    if lang not in apis:
+        try:
+            from tesserocr import PyTessBaseAPI
+            apis[lang] = PyTessBaseAPI(lang=lang) if lang else PyTessBaseAPI()
+        except (ImportError, RuntimeError):
+            apis[lang] = None
+    return apis[lang]
+
+
+def recognize_page(image, lang=OCR_LANG):
+    """OCR one preprocessed page, through tesserocr if available, otherwise through pytesseract."""
+    api = get_tesserocr_api(lang)
+    if api is not None:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    return pytesseract.image_to_string(image, lang=lang)
+
+
+def recognize_page_bytes(mode, size, data, lang=OCR_LANG):
+    """Worker task: rebuild a preprocessed page from raw pixels and OCR it."""
+    return recognize_page(Image.frombytes(mode, size, data), lang)
+
+
+def extract_text_from_image(source, parallel=None):
+    """OCR every page of an image given as a path or a binary file object; multi-page images are
+    recognized over the process pool."""
+    with Image.open(source) as image:
+        pages = [preprocess_page(page) for page in iter_pages(image)]
+
+    if parallel is None:
+        parallel = len(pages) >= OCR_PARALLEL_MIN_PAGES and OCR_WORKERS > 1
+    if not parallel:
+        return '\n'.join(recognize_page(page) for page in pages)
+
+    pool = get_ocr_pool()
+    futures = [pool.submit(recognize_page_bytes, page.mode, page.size, page.tobytes(), OCR_LANG) for page in pages]
+    return '\n'.join(future.result() for future in futures)
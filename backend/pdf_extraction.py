@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from PyPDF2 import PdfReader
+
+# PDFs with at least this many pages are split over the process pool, smaller ones are read in-process
+PDF_PARALLEL_MIN_PAGES = 16
+
+# Number of worker processes used for page-parallel extraction
+PDF_WORKERS = os.cpu_count() or 1
+
+# Pages handed to a worker at a time
+PDF_PAGES_PER_TASK = 8
+
+# Seconds a single page may take before it is skipped (enforced where SIGALRM is available)
+PDF_PAGE_TIMEOUT_SECONDS = 10
+
+# Workers are started by a fork server (or spawned where there is none) rather than forked from this
+# process, whose job, keep-alive and retention threads may hold locks a forked child would inherit held
+PDF_POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+pdf_pool = None
+
+
+class PageTimeout(Exception):
+    """Raised inside a worker when one page exceeds PDF_PAGE_TIMEOUT_SECONDS."""
+
+
+def raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def make_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PDF_POOL_START_METHOD))
+
+
+def get_pdf_pool():
+    """Process pool shared by all requests, created on first use."""
+    global pdf_pool
+    if pdf_pool is None:
+        pdf_pool = make_pool(PDF_WORKERS)
+    return pdf_pool
+
+
+def extract_page_text(page, timeout):
+    # Pages that hang the parser are skipped instead of blocking the whole document
+    if timeout and hasattr(signal, 'SIGALRM'):
+        previous = signal.signal(signal.SIGALRM, raise_page_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return page.extract_text() or ''
+        except PageTimeout:
+            print(f"Page extraction timed out after {timeout}s, skipping page")
+            return ''
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return page.extract_text() or ''
+
+
+def extract_page_range(file_path, start, end, timeout=PDF_PAGE_TIMEOUT_SECONDS):
+    """Worker task: extract pages [start, end) of the PDF and return their texts in order."""
+    reader = PdfReader(file_path)
+    return [extract_page_text(reader.pages[index], timeout) for index in range(start, end)]
+
+
+def extract_text_sequential(reader):
+    return ''.join(page.extract_text() or '' for page in reader.pages)
+
+
+def extract_text_parallel(file_path, page_count, workers=None, pages_per_task=PDF_PAGES_PER_TASK, timeout=PDF_PAGE_TIMEOUT_SECONDS):
+    """Split the pages into ranges, extract them over the process pool and join the texts in page order."""
+    pool = get_pdf_pool() if workers is None else make_pool(workers)
+    try:
+        ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+        futures = [pool.submit(extract_page_range, file_path, start, end, timeout) for start, end in ranges]
+
+        # Without SIGALRM the workers cannot time out single pages, so bound each whole range instead
+        backstop = timeout and not hasattr(signal, 'SIGALRM')
+
+        texts = []
+        for (start, end), future in zip(ranges, futures):
+            try:
+                texts.extend(future.result(timeout=timeout * (end - start) if backstop else None))
+            except FutureTimeoutError:
+                print(f"Pages {start + 1}-{end} timed out, skipping them")
+        return ''.join(texts)
+    finally:
+        if workers is not None:
+            pool.shutdown()
+
+
+def extract_text_from_pdf(source, parallel=None):
+    """Extract the text of a PDF given as a path or a binary file object; large documents are extracted
+    page-parallel unless parallel=False."""
+    reader = PdfReader(source)
+    page_count = len(reader.pages)
+    if parallel is None:
+        parallel = page_count >= PDF_PARALLEL_MIN_PAGES and PDF_WORKERS > 1
+    if not parallel:
+        return extract_text_sequential(reader)
+    if isinstance(source, (str, os.PathLike)):
+        return extract_text_parallel(source, page_count)
+
+    # The worker processes open the PDF by path, so an upload held in memory is written out once
+    temp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        with temp_file:
+            source.seek(0)
+            shutil.copyfileobj(source, temp_file)
+        return extract_text_parallel(temp_file.name, page_count)
+    finally:
+        os.remove(temp_file.name)
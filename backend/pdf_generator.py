@@ -1,11 +1,11 @@
 
-import json
+import io
 import os
 import time
 import textwrap
-from reportlab.lib.units import mm
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+import uuid
+
+from section_parsing import SectionParseError, parse_section
 
 
 INVOICE_FOLDER = './invoices'
@@ -34,14 +34,47 @@ def clean_json_string(json_string):
     return cleaned_string
 
 
-def generate_invoice_from_text(processed_data, original_filename):
-    # Create a unique invoice filename based on timestamp and original filename
+def parse_section_json(processed_data, section):
+    """Section of the processed data as a dictionary, repaired and completed to its schema."""
+    return parse_section(section, clean_json_string(processed_data[section]))[0]
+
+
+def make_invoice_filename(original_filename):
+    # Create a unique invoice filename based on timestamp and original filename; the random part keeps
+    # conversions of the same filename in the same second (parallel jobs, batches, hosts sharing a store)
+    # apart, and makes another client's invoice name unguessable
     timestamp = int(time.time())
-    invoice_filename = f'invoice_{timestamp}_{original_filename}.pdf'
-    invoice_path = os.path.join(INVOICE_FOLDER, invoice_filename)
+    return f'invoice_{timestamp}_{uuid.uuid4().hex}_{original_filename}.pdf'
+
+
+def generate_invoice_from_text(processed_data, original_filename):
+    invoice_path = os.path.join(INVOICE_FOLDER, make_invoice_filename(original_filename))
+    if not draw_invoice_from_text(invoice_path, processed_data):
+        return None
+    return invoice_path
+
+
+def render_invoice_from_text(processed_data):
+    """PDF bytes of the invoice, rendered in memory; None if the AI response could not be parsed."""
+    buffer = io.BytesIO()
+    if not draw_invoice_from_text(buffer, processed_data):
+        return None
+    return buffer.getvalue()
 
+
+def load_reportlab():
+    # reportlab is imported on the first invoice rather than at startup, so new workers start faster
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.pdfgen import canvas
+    return canvas, A4, mm
+
+
+def draw_invoice_from_text(target, processed_data):
+    # target is a file path or a writable binary file object
+    canvas, A4, mm = load_reportlab()
     # Create a new PDF using ReportLab
-    c = canvas.Canvas(invoice_path, pagesize=A4)
+    c = canvas.Canvas(target, pagesize=A4)
     page_width, page_height = A4
 
     # Set title
@@ -57,10 +90,10 @@ def generate_invoice_from_text(processed_data, original_filename):
 
     # Parse the JSON strings into dictionaries
     try:
-        invoice_info = json.loads(clean_json_string(processed_data['invoice_information']))
-    except json.JSONDecodeError as e:
+        invoice_info = parse_section_json(processed_data, 'invoice_information')
+    except SectionParseError as e:
         print(f"Error parsing JSON: {e}")
-        return None
+        return False
 
     def draw_wrapped_text(text, x, y, max_width, font_size=10):
         c.setFont("Courier", font_size)
@@ -138,19 +171,19 @@ def generate_invoice_from_text(processed_data, original_filename):
     # Save the PDF
     c.save()
 
-    return invoice_path
+    return True
 
 
 def generate_invoice_json(processed_data):
     try:
-        invoice_info = json.loads(clean_json_string(processed_data['invoice_information']))
-        service_details = json.loads(clean_json_string(processed_data['service_details']))
-        calculation_details = json.loads(clean_json_string(processed_data['calculation_details']))
-        payment_instructions = json.loads(clean_json_string(processed_data['payment_instructions']))
-        special_conditions = json.loads(clean_json_string(processed_data['special_conditions']))
-        customer_info = json.loads(clean_json_string(processed_data['customer_information']))
-        additional_info = json.loads(clean_json_string(processed_data['additional_information']))
-    except json.JSONDecodeError as e:
+        invoice_info = parse_section_json(processed_data, 'invoice_information')
+        service_details = parse_section_json(processed_data, 'service_details')
+        calculation_details = parse_section_json(processed_data, 'calculation_details')
+        payment_instructions = parse_section_json(processed_data, 'payment_instructions')
+        special_conditions = parse_section_json(processed_data, 'special_conditions')
+        customer_info = parse_section_json(processed_data, 'customer_information')
+        additional_info = parse_section_json(processed_data, 'additional_information')
+    except SectionParseError as e:
         print(f"Error parsing JSON: {e}")
         return None
 
@@ -201,13 +234,23 @@ def generate_invoice_json(processed_data):
 
 
 def generate_invoice_from_json(invoice_json, original_filename):
-    # Create a unique invoice filename based on timestamp and original filename
-    timestamp = int(time.time())
-    invoice_filename = f'invoice_{timestamp}_{original_filename}.pdf'
-    invoice_path = os.path.join(INVOICE_FOLDER, invoice_filename)
+    invoice_path = os.path.join(INVOICE_FOLDER, make_invoice_filename(original_filename))
+    draw_invoice_from_json(invoice_path, invoice_json)
+    return invoice_path
+
+
+def render_invoice_from_json(invoice_json):
+    """PDF bytes of the invoice, rendered in memory."""
+    buffer = io.BytesIO()
+    draw_invoice_from_json(buffer, invoice_json)
+    return buffer.getvalue()
 
+
+def draw_invoice_from_json(target, invoice_json):
+    # target is a file path or a writable binary file object
+    canvas, A4, mm = load_reportlab()
     # Create a new PDF using ReportLab
-    c = canvas.Canvas(invoice_path, pagesize=A4)
+    c = canvas.Canvas(target, pagesize=A4)
     page_width, page_height = A4
 
     # Set some margins
@@ -304,5 +347,3 @@ def generate_invoice_from_json(invoice_json, original_filename):
 
     # Save PDF
     c.save()
-
-    return invoice_path
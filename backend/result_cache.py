@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Folder holding the on-disk tier of the result cache
+CACHE_FOLDER = './cache'
+
+# In-memory tier: number of results kept in the LRU
+CACHE_MAX_ENTRIES = 128
+
+# On-disk tier: total size quota in bytes, oldest entries are evicted first
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Entries older than this are treated as misses and removed (both tiers)
+CACHE_TTL_SECONDS = 7 * 24 * 3600
+
+
+def make_cache_key(text, model, engine, prompt_fingerprint):
+    """Content-addressed key: the same text, model, engine and prompts always map to the same entry."""
+    digest = hashlib.sha256()
+    for part in (prompt_fingerprint, model, engine, text):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache for process_contract results: an in-memory LRU backed by JSON files on disk."""
+
+    def __init__(self, folder=CACHE_FOLDER, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+        os.makedirs(self.folder, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.folder, f'{key}.json')
+
+    def expired(self, created):
+        return time.time() - created > self.ttl
+
+    def get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                if not self.expired(entry['created']):
+                    self.memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry['result']
+                del self.memory[key]
+
+            entry = self.read_entry(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.remember(key, entry)
+            self.stats['disk_hits'] += 1
+            return entry['result']
+
+    def put(self, key, result, fingerprint=''):
+        entry = {'created': time.time(), 'fingerprint': fingerprint, 'result': result}
+        with self.lock:
+            self.remember(key, entry)
+            self.write_entry(key, entry)
+            self.stats['writes'] += 1
+            self.enforce_disk_quota()
+
+    def remember(self, key, entry):
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def read_entry(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if self.expired(entry.get('created', 0)):
+            self.remove_file(path)
+            return None
+        return entry
+
+    def write_entry(self, key, entry):
+        # Write to a temporary file and rename it, so readers never see a partial entry
+        path = self.entry_path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(entry, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def remove_file(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def disk_entries(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def enforce_disk_quota(self):
+        entries = self.disk_entries()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                break
+            if self.remove_file(path):
+                self.stats['evictions'] += 1
+            total -= size
+
+    def invalidate(self, fingerprint=None):
+        """Drop every entry, or only the entries not created with the given prompt fingerprint."""
+        removed = 0
+        with self.lock:
+            for key in list(self.memory):
+                if fingerprint is None or self.memory[key]['fingerprint'] != fingerprint:
+                    del self.memory[key]
+            for _, _, path in self.disk_entries():
+                if fingerprint is not None:
+                    try:
+                        with open(path, 'r', encoding='utf-8') as file:
+                            if json.load(file).get('fingerprint') == fingerprint:
+                                continue
+                    except (OSError, json.JSONDecodeError):
+                        pass
+                if self.remove_file(path):
+                    removed += 1
+        return removed
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self.memory)
+            stats['disk_entries'] = len(self.disk_entries())
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
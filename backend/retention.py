@@ -0,0 +1,190 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import metrics
+
+# Seconds between two sweeps of the retention daemon
+RETENTION_INTERVAL_SECONDS = 600
+
+# Files younger than this are never deleted, so half-written files and just-submitted uploads are safe
+RETENTION_MIN_AGE_SECONDS = 300
+
+# Name prefix of entries renamed out of the way just before they are deleted
+TOMBSTONE_PREFIX = '.deleting-'
+
+
+class Leases:
+    """Paths currently in use (queued conversions, downloads); the daemon never deletes a leased path."""
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def release(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            count = self.counts.get(path, 0) - 1
+            if count > 0:
+                self.counts[path] = count
+            else:
+                self.counts.pop(path, None)
+
+    @contextmanager
+    def hold(self, path):
+        """Lease path for the duration of a block."""
+        self.acquire(path)
+        try:
+            yield
+        finally:
+            self.release(path)
+
+
+leases = Leases()
+
+
+class FolderRetention:
+    """Age and size quota of one folder. Entries (files, or whole sub-folders such as batch uploads) older
+    than max_age_seconds are deleted, then the oldest ones until the folder fits in max_bytes."""
+
+    def __init__(self, name, folder, max_age_seconds=None, max_bytes=None):
+        self.name = name
+        self.folder = folder
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.last_sweep = {'entries': 0, 'bytes': 0, 'deleted_files': 0, 'reclaimed_bytes': 0, 'finished': None}
+
+    def scan(self):
+        """[(modified, size, path, is_dir)] of every entry of the folder, oldest first."""
+        entries = []
+        try:
+            iterator = os.scandir(self.folder)
+        except FileNotFoundError:
+            return entries
+        with iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        modified, size = self.tree_stats(entry.path, entry.stat().st_mtime)
+                        entries.append((modified, size, entry.path, True))
+                    else:
+                        stat = entry.stat(follow_symlinks=False)
+                        entries.append((stat.st_mtime, stat.st_size, entry.path, False))
+                except FileNotFoundError:
+                    continue
+        entries.sort()
+        return entries
+
+    def tree_stats(self, path, modified):
+        # A sub-folder is as recent as its newest file
+        size = 0
+        for root, _, files in os.walk(path):
+            for filename in files:
+                try:
+                    stat = os.stat(os.path.join(root, filename))
+                except FileNotFoundError:
+                    continue
+                size += stat.st_size
+                modified = max(modified, stat.st_mtime)
+        return modified, size
+
+    def delete(self, path, is_dir):
+        """Atomically take path out of the folder, then remove it; False if it is leased or already gone."""
+        with leases.lock:
+            if os.path.abspath(path) in leases.counts:
+                return False
+            # After the rename, new readers get a clean "not found" instead of a half-deleted file
+            tombstone = os.path.join(os.path.dirname(path), f'{TOMBSTONE_PREFIX}{uuid.uuid4().hex}')
+            try:
+                os.replace(path, tombstone)
+            except OSError:
+                return False
+        self.remove(tombstone, is_dir)
+        return True
+
+    def remove(self, path, is_dir):
+        try:
+            if is_dir:
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            # Left for the next sweep, e.g. a file still open on Windows
+            print(f"Could not delete {path}: {e}")
+
+    def sweep(self, now=None):
+        """Delete expired entries, then the oldest ones over the size quota; returns (files deleted, bytes reclaimed)."""
+        now = time.time() if now is None else now
+        entries = self.scan()
+        total = sum(size for _, size, _, _ in entries)
+        deleted, reclaimed, kept = 0, 0, len(entries)
+
+        for modified, size, path, is_dir in entries:
+            age = now - modified
+            if os.path.basename(path).startswith(TOMBSTONE_PREFIX):
+                # Left over from an interrupted sweep; its bytes were already counted as reclaimed
+                self.remove(path, is_dir)
+                total -= size
+                kept -= 1
+                continue
+            if age < RETENTION_MIN_AGE_SECONDS:
+                continue
+            expired = self.max_age_seconds is not None and age > self.max_age_seconds
+            over_quota = self.max_bytes is not None and total > self.max_bytes
+            if not expired and not over_quota:
+                continue
+            if self.delete(path, is_dir):
+                deleted += 1
+                reclaimed += size
+                total -= size
+                kept -= 1
+
+        metrics.inc('retention_deleted_files_total', deleted, folder=self.name)
+        metrics.inc('retention_reclaimed_bytes_total', reclaimed, folder=self.name)
+        self.last_sweep = {'entries': kept, 'bytes': total, 'deleted_files': deleted,
+                           'reclaimed_bytes': reclaimed, 'finished': time.time()}
+        return deleted, reclaimed
+
+
+class RetentionDaemon:
+    """Background thread sweeping every folder policy each RETENTION_INTERVAL_SECONDS."""
+
+    def __init__(self, policies, interval=RETENTION_INTERVAL_SECONDS):
+        self.policies = policies
+        self.interval = interval
+        self.thread = None
+        metrics.register_gauge('retention_folder_bytes', 'Bytes kept per retention-managed folder after the last sweep.', lambda: [
+            ({'folder': policy.name}, policy.last_sweep['bytes']) for policy in self.policies
+        ])
+
+    def sweep(self):
+        results = {}
+        for policy in self.policies:
+            try:
+                results[policy.name] = policy.sweep()
+            except OSError as e:
+                print(f"Retention sweep of {policy.folder} failed: {e}")
+        return results
+
+    def run(self):
+        while True:
+            self.sweep()
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='retention', daemon=True)
+            self.thread.start()
+        return self
+
+    def get_stats(self):
+        return {policy.name: dict(policy.last_sweep, folder=policy.folder, max_age_seconds=policy.max_age_seconds,
+                                  max_bytes=policy.max_bytes) for policy in self.policies}
@@ -0,0 +1,98 @@
+import difflib
+import re
+
+from chunking import is_heading
+from rule_extraction import AMOUNT_PATTERN, BIC_PATTERN, DATE_PATTERN, IBAN_PATTERN, IDNO_PATTERN, VAT_PATTERN
+
+# Words of a changed clause (or of the heading it sits under) and the sections that clause can affect.
+# Stems cover English and Romanian contracts, with and without diacritics.
+SECTION_KEYWORDS = {
+    'invoice_information': r'invoice|factur|bill|client|customer|beneficiar|provider|supplier|prestator|furnizor|executant|'
+                           r'address|adres|e-?mail|phone|telefon|bank|banc|iban|swift|bic|account|cont\b|due|scaden|termen',
+    'service_details': r'servic|product|produs|deliver|livr|quantit|cantit|unit|hour|or[ae]\b|day|zi\b|zile|rate|tarif|'
+                       r'price|pre[tț]|scope|obiect|milestone|etap|lucrar|works?\b',
+    'calculation_details': r'price|pre[tț]|amount|sum[aă]|total|valoare|value|rate|tarif|vat|tva|tax|tax[aă]|impozit|'
+                           r'currency|valut|exchange|curs|discount|reducere|install|rat[aăe]\b|subtotal',
+    'payment_instructions': r'pay|pl[aă]t|achit|bank|banc|iban|swift|bic|account|cont\b|due|scaden|termen|transfer|'
+                            r'penalt|penalit|late|[iî]nt[aâ]rzi',
+    'special_conditions': r'penalt|penalit|late|[iî]nt[aâ]rzi|discount|reducere|pro[ -]?rata|annex|anex|agreement|acord|'
+                          r'contract n|terminat|reziliere|force majeure|for[tț][aă] major',
+    'customer_information': r'client|customer|beneficiar|address|adres|e-?mail|phone|telefon|contact|idno|fiscal|vat|tva|'
+                            r'represent|reprezent|director|administrator',
+}
+SECTION_PATTERNS = {section: re.compile(keywords, re.IGNORECASE) for section, keywords in SECTION_KEYWORDS.items()}
+
+# Values the rules recognize, and the sections they appear in
+VALUE_SECTIONS = [
+    (IBAN_PATTERN, ('invoice_information', 'payment_instructions')),
+    (BIC_PATTERN, ('invoice_information', 'payment_instructions')),
+    (IDNO_PATTERN, ('invoice_information', 'customer_information')),
+    (VAT_PATTERN, ('invoice_information', 'customer_information')),
+    (DATE_PATTERN, ('invoice_information', 'payment_instructions')),
+    (AMOUNT_PATTERN, ('service_details', 'calculation_details', 'invoice_information')),
+]
+
+# Changed text no keyword or value matches still goes somewhere: the catch-all section
+FALLBACK_SECTION = 'additional_information'
+
+
+def diff_texts(previous, current):
+    """Changed spans between two versions of a contract, line by line.
+
+    Returns [{'previous', 'current', 'heading', 'position'}]: the old and new lines of each changed span,
+    the heading of the clause it belongs to and its character offset in the current text.
+    """
+    previous_lines = previous.splitlines()
+    current_lines = current.splitlines()
+    matcher = difflib.SequenceMatcher(None, previous_lines, current_lines, autojunk=False)
+
+    offsets = [0]
+    for line in current_lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        old = '\n'.join(previous_lines[i1:i2]).strip()
+        new = '\n'.join(current_lines[j1:j2]).strip()
+        # Whitespace-only changes (re-wrapped lines, extra blank lines) do not affect any section
+        if re.sub(r'\s+', '', old) == re.sub(r'\s+', '', new):
+            continue
+        heading = next((line.strip() for line in reversed(current_lines[:j1]) if is_heading(line)), '')
+        changes.append({'previous': old, 'current': new, 'heading': heading, 'position': offsets[j1]})
+    return changes
+
+
+def changed_ratio(changes, current):
+    """Share of the current text covered by changed spans; deletions count with their old size."""
+    changed = sum(max(len(change['previous']), len(change['current'])) for change in changes)
+    return min(1.0, changed / max(1, len(current)))
+
+
+def affected_sections(changes):
+    """Sections whose content can depend on the changed spans, in no particular order."""
+    sections = set()
+    for change in changes:
+        text = '\n'.join((change['heading'], change['previous'], change['current']))
+        matched = {section for section, pattern in SECTION_PATTERNS.items() if pattern.search(text)}
+        for pattern, value_sections in VALUE_SECTIONS:
+            if pattern.search(change['previous']) or pattern.search(change['current']):
+                matched.update(value_sections)
+        sections.update(matched or {FALLBACK_SECTION})
+    return sections
+
+
+def describe_changes(changes):
+    """Addendum to the previous main analysis, telling the secondary prompts what the revision changed."""
+    lines = ['', 'Revision: the following clauses of the contract were changed. Where they contradict the analysis above, '
+             'the revised text takes precedence.']
+    for change in changes:
+        where = f" (under \"{change['heading']}\")" if change['heading'] else ''
+        if change['previous'] and change['current']:
+            lines.append(f"- Changed{where}:\n  Before: {change['previous']}\n  After: {change['current']}")
+        elif change['current']:
+            lines.append(f"- Added{where}: {change['current']}")
+        else:
+            lines.append(f"- Removed{where}: {change['previous']}")
+    return '\n'.join(lines)
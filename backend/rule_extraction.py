@@ -0,0 +1,246 @@
+import json
+import re
+from collections import Counter
+from datetime import date
+
+from section_schemas import SECTION_SCHEMAS
+
+# Bumped whenever a rule changes, so cached results produced by older rules are invalidated
+RULES_VERSION = 3
+
+# Rule values at or above this confidence may replace an LLM call or an LLM value
+RULE_MIN_CONFIDENCE = 0.9
+
+# IBAN lengths of the countries seen in our contracts; other countries only get the generic 15-34 check
+IBAN_LENGTHS = {
+    'MD': 24, 'RO': 24, 'UA': 29, 'DE': 22, 'FR': 27, 'IT': 27, 'ES': 24, 'NL': 18, 'BE': 16, 'AT': 20,
+    'PL': 28, 'BG': 22, 'GB': 22, 'IE': 22, 'CH': 21, 'LU': 20, 'CZ': 24, 'HU': 28, 'LT': 20, 'LV': 21,
+    'EE': 20, 'PT': 25, 'GR': 27, 'SE': 24, 'DK': 18, 'FI': 18, 'NO': 15, 'TR': 26, 'CY': 28, 'MT': 31,
+}
+
+CURRENCY_CODES = {'EUR', 'USD', 'MDL', 'RON', 'GBP', 'CHF', 'UAH', 'PLN'}
+CURRENCY_SYMBOLS = {'€': 'EUR', '$': 'USD', '£': 'GBP'}
+
+IBAN_PATTERN = re.compile(r'\b[A-Z]{2}\d{2}(?: ?[A-Z0-9]{4}){2,7}(?: ?[A-Z0-9]{1,4})?\b')
+BIC_PATTERN = re.compile(r'\b(?:SWIFT|BIC)(?:\s*/\s*(?:SWIFT|BIC))?(?:\s+code)?\s*[:\-]?\s*([A-Z]{4}[A-Z]{2}[A-Z0-9]{2}(?:[A-Z0-9]{3})?)\b', re.IGNORECASE)
+IDNO_PATTERN = re.compile(r'\b(?:IDNO|IDNP|cod fiscal|c/f)\s*[:\-]?\s*(\d{13})\b', re.IGNORECASE)
+VAT_PATTERN = re.compile(r'\b(?:VAT|TVA|cod TVA|VAT ID|USt-IdNr\.?)\s*(?:No\.?|nr\.?)?\s*[:\-]?\s*([A-Z]{2} ?[0-9A-Z]{8,12})\b')
+DATE_PATTERN = re.compile(r'\b(?:(\d{1,2})([./-])(\d{1,2})\2(\d{4})|(\d{4})-(\d{2})-(\d{2}))\b')
+NUMBER = r'\d{1,3}(?:[ .,]\d{3})+(?:[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?'
+CURRENCY = r'EUR|USD|MDL|RON|GBP|CHF|UAH|PLN|€|\$|£'
+AMOUNT_PATTERN = re.compile(rf'(?:({CURRENCY})\s?({NUMBER})|\b({NUMBER})\s?({CURRENCY}))(?![\w%])')
+
+# Leaves of the section schemas a rule can fill, mapped to the rule field that fills them
+RULE_LEAVES = {
+    'iban': 'ibans',
+    'swift_bic': 'swift_bics',
+    'vat_or_tax_id': 'tax_ids',
+    'currency': 'currencies',
+}
+
+# Sections whose empty IBAN, SWIFT and currency leaves may be filled from the contract text. Elsewhere
+# only wrong values are corrected: which party an IBAN belongs to is not known to the rules.
+FILL_EMPTY_SECTIONS = ('payment_instructions', 'calculation_details')
+
+
+def iban_checksum_ok(iban):
+    digits = ''.join(str(int(char, 36)) for char in iban[4:] + iban[:4])
+    return int(digits) % 97 == 1
+
+
+def validate_iban(candidate):
+    """Normalized IBAN and its confidence, or None if the candidate fails the length or mod-97 check."""
+    iban = candidate.replace(' ', '').upper()
+    length = IBAN_LENGTHS.get(iban[:2])
+    if length is not None:
+        # Trailing words can run into a spaced IBAN; cut it to the length of its country
+        iban = iban[:length]
+        if len(iban) != length:
+            return None
+    if not 15 <= len(iban) <= 34 or not iban.isalnum() or not iban_checksum_ok(iban):
+        return None
+    return iban, 0.99 if length is not None else 0.9
+
+
+def parse_amount(number):
+    """Decimal string of an amount written as 1.000,50, 1,000.50, 1 000 or 1000.5."""
+    number = number.replace(' ', '')
+    cents = re.search(r'[.,](\d{1,2})$', number)
+    whole = re.sub(r'[.,]', '', number[:cents.start()] if cents else number) or '0'
+    return f"{int(whole)}.{(cents.group(1) if cents else '0').ljust(2, '0')}"
+
+
+def add_candidate(found, field, value, confidence, position, **extra):
+    # Keep one candidate per value, with its best confidence and first position
+    for candidate in found[field]:
+        if candidate['value'] == value and candidate.get('currency') == extra.get('currency'):
+            candidate['confidence'] = max(candidate['confidence'], confidence)
+            return
+    found[field].append(dict({'value': value, 'confidence': confidence, 'position': position}, **extra))
+
+
+def pre_extract(text):
+    """Rule-based extraction of IBANs, SWIFT/BIC codes, tax IDs, dates and amounts from raw contract text.
+
+    Returns {field: [{'value', 'confidence', 'position', ...}, ...]} in order of first appearance. A typical
+    contract takes a few milliseconds.
+    """
+    found = {'ibans': [], 'swift_bics': [], 'tax_ids': [], 'dates': [], 'amounts': [], 'currencies': []}
+
+    for match in IBAN_PATTERN.finditer(text):
+        validated = validate_iban(match.group())
+        if validated is not None:
+            add_candidate(found, 'ibans', validated[0], validated[1], match.start())
+
+    iban_countries = {candidate['value'][:2] for candidate in found['ibans']}
+    for match in BIC_PATTERN.finditer(text):
+        bic = match.group(1).upper()
+        # A BIC of the same country as one of the IBANs is almost certainly right
+        add_candidate(found, 'swift_bics', bic, 0.99 if bic[4:6] in iban_countries else 0.9, match.start(1))
+
+    for match in IDNO_PATTERN.finditer(text):
+        # 13 digits right after an IDNO or fiscal code label
+        add_candidate(found, 'tax_ids', match.group(1), 0.95, match.start(1))
+    for match in VAT_PATTERN.finditer(text):
+        add_candidate(found, 'tax_ids', match.group(1).replace(' ', ''), 0.9, match.start(1))
+
+    for match in DATE_PATTERN.finditer(text):
+        if match.group(1):
+            day, month, year = int(match.group(1)), int(match.group(3)), int(match.group(4))
+            # Day and month can be swapped in d/m/Y dates; dots and dashes are day-first in our contracts
+            confidence = 0.6 if match.group(2) == '/' and day <= 12 and month <= 12 else 0.9
+        else:
+            year, month, day = int(match.group(5)), int(match.group(6)), int(match.group(7))
+            confidence = 0.95
+        try:
+            value = date(year, month, day).isoformat()
+        except ValueError:
+            continue
+        add_candidate(found, 'dates', value, confidence, match.start())
+
+    for match in AMOUNT_PATTERN.finditer(text):
+        symbol = match.group(1) or match.group(4)
+        currency = CURRENCY_SYMBOLS.get(symbol, symbol.upper())
+        add_candidate(found, 'amounts', parse_amount(match.group(2) or match.group(3)), 0.9, match.start(), currency=currency)
+
+    # The contract currency is the one most amounts are written in
+    counts = Counter(amount['currency'] for amount in found['amounts'])
+    if counts:
+        currency, count = counts.most_common(1)[0]
+        add_candidate(found, 'currencies', currency, round(count / sum(counts.values()), 2), 0)
+    return found
+
+
+def sole_value(fields, field):
+    """The only confident candidate of a field, or None when there is none or the text has several."""
+    candidates = [candidate for candidate in fields.get(field, []) if candidate['confidence'] >= RULE_MIN_CONFIDENCE]
+    return candidates[0]['value'] if len(candidates) == 1 else None
+
+
+def fill_schema(schema, fields):
+    # Instance of the schema built from rule values only, or None as soon as one leaf has no rule value
+    if schema.get('type') == 'object':
+        filled = {}
+        for name, field_schema in schema.get('properties', {}).items():
+            if field_schema.get('type') in ('object', 'array'):
+                value = fill_schema(field_schema, fields)
+            else:
+                value = sole_value(fields, RULE_LEAVES[name]) if name in RULE_LEAVES else None
+            if value is None:
+                return None
+            filled[name] = value
+        return filled
+    return None
+
+
+def fill_section(section, fields):
+    """JSON string of a section when every one of its fields has an unambiguous confident rule value, else None."""
+    filled = fill_schema(SECTION_SCHEMAS[section], fields)
+    return json.dumps(filled, ensure_ascii=False) if filled is not None else None
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def closest_value(value, candidates, max_distance):
+    """Confident candidate nearest to value, if it is within max_distance edits."""
+    best = None
+    for candidate in candidates:
+        if candidate['confidence'] < RULE_MIN_CONFIDENCE:
+            continue
+        distance = edit_distance(value, candidate['value'])
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, candidate['value'])
+    return best[1] if best else None
+
+
+def checked_value(leaf, value, fields, fill_empty):
+    """Value to keep for one LLM leaf: the LLM value if it checks out, else the rule value it most likely meant."""
+    field = RULE_LEAVES[leaf]
+    candidates = fields.get(field, [])
+    normalized = re.sub(r'[\s.-]', '', value).upper() if isinstance(value, str) else ''
+
+    if not normalized or normalized in ('N/A', 'NULL', 'NONE'):
+        return sole_value(fields, field) if fill_empty else None
+    if leaf == 'iban':
+        validated = validate_iban(normalized)
+        iban = validated[0] if validated is not None else normalized
+        if any(candidate['value'] == iban for candidate in candidates):
+            return None
+        # An IBAN the contract does not contain is garbled (wrong digit, missing group) or made up. A garbled
+        # one is replaced by the contract's IBAN it resembles; with no IBAN in the text it is kept as it is
+        closest = closest_value(iban, candidates, 4)
+        if closest is not None or not candidates:
+            return closest
+        # A made-up one becomes the contract's only IBAN where that IBAN is the one asked for (the payment
+        # sections); elsewhere it may be another party's, so it is cleared rather than reassigned
+        return (sole_value(fields, field) or '') if fill_empty else ''
+    if leaf == 'currency':
+        if normalized in CURRENCY_CODES:
+            return None
+        return CURRENCY_SYMBOLS.get(value.strip()) or sole_value(fields, field)
+    if any(candidate['value'] == normalized for candidate in candidates):
+        return None
+    return closest_value(normalized, candidates, 2)
+
+
+def correct_object(data, fields, fill_empty, corrections):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            correct_object(value, fields, fill_empty, corrections)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    correct_object(item, fields, fill_empty, corrections)
+        elif key in RULE_LEAVES:
+            replacement = checked_value(key, value, fields, fill_empty)
+            if replacement is not None and replacement != value:
+                data[key] = replacement
+                corrections.append(key)
+
+
+def correct_section(section, content, fields):
+    """Check the IBAN, SWIFT, tax ID and currency values of an LLM section against the rule values.
+
+    Returns the section JSON string, with wrong values replaced by the rule value they most likely meant,
+    and the list of corrected field names. Content that is not JSON is returned unchanged.
+    """
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return content, []
+    if not isinstance(data, dict):
+        return content, []
+
+    corrections = []
+    correct_object(data, fields, section in FILL_EMPTY_SECTIONS, corrections)
+    if not corrections:
+        return content, []
+    return json.dumps(data, ensure_ascii=False), corrections
@@ -0,0 +1,172 @@
+import ast
+import json
+import re
+import threading
+
+from section_schemas import SECTION_SCHEMAS
+
+# Quotes models use instead of plain double quotes
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '„': '"', '‘': "'", '’': "'"})
+
+CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$', re.IGNORECASE)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class SectionParseError(ValueError):
+    """Raised when a section's content cannot be repaired into an instance of its schema."""
+
+
+class RetryBudget:
+    """Number of secondary calls that may still be re-issued for one contract, shared by all its sections."""
+
+    def __init__(self, total):
+        self.remaining = total
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+def close_brackets(text):
+    # Output cut off by the token limit: close the open string, then every open object and array
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    if in_string:
+        text += '"'
+    return TRAILING_COMMA.sub(r'\1', text.rstrip().rstrip(',') + ''.join(reversed(stack)))
+
+
+def repair_json(content):
+    """Parse model output that is meant to be a JSON object, fixing the usual mistakes on the way.
+
+    Handles code fences, text around the object, smart quotes, trailing commas, raw control characters
+    in strings, Python-style literals with single quotes and output truncated mid-object. Returns
+    (data, repaired) or raises SectionParseError.
+    """
+    if not isinstance(content, str):
+        raise SectionParseError(f'Expected a JSON string, got {type(content).__name__}')
+    try:
+        return json.loads(content), False
+    except json.JSONDecodeError:
+        pass
+
+    text = CODE_FENCE.sub('', content).translate(SMART_QUOTES).strip()
+    start = text.find('{')
+    if start == -1:
+        raise SectionParseError('No JSON object in the response')
+    end = text.rfind('}')
+    candidates = [text[start:end + 1]] if end > start else []
+    candidates.append(close_brackets(text[start:]))
+
+    for candidate in candidates:
+        for attempt in (candidate, TRAILING_COMMA.sub(r'\1', candidate)):
+            try:
+                return json.loads(attempt, strict=False), True
+            except json.JSONDecodeError:
+                pass
+        try:
+            # {'key': 'value', 'flag': True}: a Python dict printed instead of JSON
+            literal = re.sub(r'\btrue\b', 'True', re.sub(r'\bfalse\b', 'False', re.sub(r'\bnull\b', 'None', candidate)))
+            data = ast.literal_eval(literal)
+            if isinstance(data, (dict, list)):
+                return data, True
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+    raise SectionParseError('Response is not valid JSON and could not be repaired')
+
+
+def coerce(data, schema, counts):
+    """Instance of schema built from data: missing fields become empty, scalars become strings, extra
+    fields are kept.
+
+    counts['present'] counts the leaves the model actually filled, counts['changed'] every coercion.
+    """
+    if schema.get('type') == 'object':
+        if isinstance(data, list):
+            # A list where the schema has one object, e.g. two invoices or two bill_to parties: only arrays
+            # may become lists, since the invoice renderer reads these fields as objects, so keep the first
+            counts['changed'] += 1
+            data = next((item for item in data if isinstance(item, dict)), {})
+        if not isinstance(data, dict):
+            counts['changed'] += 1
+            data = {}
+        result = {}
+        for name, field_schema in schema.get('properties', {}).items():
+            if name not in data:
+                counts['changed'] += 1
+            result[name] = coerce(data.get(name), field_schema, counts)
+        # Extra keys are kept: the prompts invite the model to add categories of its own
+        for name, value in data.items():
+            if name not in result:
+                result[name] = value
+        return result
+    if schema.get('type') == 'array':
+        if isinstance(data, dict):
+            counts['changed'] += 1
+            data = [data]
+        elif not isinstance(data, list):
+            counts['changed'] += 1
+            data = []
+        return [coerce(item, schema['items'], counts) for item in data]
+
+    if data is None:
+        return ''
+    if isinstance(data, str):
+        counts['present'] += 1
+        return data
+    counts['changed'] += 1
+    if isinstance(data, (dict, list)):
+        counts['present'] += 1
+        return json.dumps(data, ensure_ascii=False)
+    counts['present'] += 1
+    return str(data)
+
+
+def unwrap(section, data):
+    # Sections other than invoice_information are wrapped in an object keyed by the section name;
+    # models often drop that wrapper or add one where there is none
+    schema = SECTION_SCHEMAS[section]
+    wrapped = list(schema['properties']) == [section]
+    if wrapped and isinstance(data, list):
+        return {section: data}, True
+    if not isinstance(data, dict):
+        return data, False
+    if wrapped and section not in data:
+        return {section: data}, True
+    if not wrapped and section in data and isinstance(data[section], dict):
+        return data[section], True
+    return data, False
+
+
+def parse_section(section, content):
+    """Validated instance of the section's schema from the model's response text.
+
+    Returns (data, repaired), where repaired tells whether anything had to be fixed. Raises
+    SectionParseError when the text is not JSON, or when it matches none of the section's fields.
+    """
+    data, repaired = repair_json(content)
+    data, rewrapped = unwrap(section, data)
+    counts = {'present': 0, 'changed': 0}
+    data = coerce(data, SECTION_SCHEMAS[section], counts)
+    if counts['present'] == 0:
+        raise SectionParseError(f'Response has none of the {section} fields')
+    return data, repaired or rewrapped or counts['changed'] > 0
@@ -0,0 +1,121 @@
+# JSON schemas for the output of each secondary prompt in ai_processing.py.
+# Every schema mirrors the JSON template written in the matching set_*_prompt() function.
+
+def string_object(*fields):
+    """Helper to describe an object whose fields are all strings."""
+    return {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in fields},
+        "required": list(fields)
+    }
+
+
+def nested_object(fields):
+    """Helper to describe an object from a dict of field name -> schema."""
+    return {
+        "type": "object",
+        "properties": fields,
+        "required": list(fields)
+    }
+
+
+CONTACT_INFORMATION = string_object("email", "phone")
+
+BANKING_INFORMATION = string_object("bank_name", "account_name", "iban", "swift_bic")
+
+INVOICE_INFORMATION = nested_object({
+    "invoice_number": {"type": "string"},
+    "invoice_date": {"type": "string"},
+    "due_date": {"type": "string"},
+    "bill_to": nested_object({
+        "client_name": {"type": "string"},
+        "company_name": {"type": "string"},
+        "address": {"type": "string"},
+        "contact_information": CONTACT_INFORMATION,
+        "banking_information": BANKING_INFORMATION
+    }),
+    "bill_from": nested_object({
+        "provider_name": {"type": "string"},
+        "company_name": {"type": "string"},
+        "address": {"type": "string"},
+        "contact_information": CONTACT_INFORMATION,
+        "banking_information": BANKING_INFORMATION
+    }),
+    "payment_terms": {"type": "string"}
+})
+
+SERVICE_DETAILS = nested_object({
+    "service_details": {
+        "type": "array",
+        "items": string_object("description", "unit_of_measure", "quantity", "rate_per_unit", "total_amount")
+    }
+})
+
+CALCULATION_DETAILS = nested_object({
+    "calculation_details": nested_object({
+        "subtotal": {"type": "string"},
+        "taxes": string_object("tax_rate", "tax_amount"),
+        "total_amount_due": {"type": "string"},
+        "currency": {"type": "string"},
+        "exchange_rate": string_object("rate", "from_currency", "to_currency")
+    })
+})
+
+PAYMENT_INSTRUCTIONS = nested_object({
+    "payment_instructions": string_object(
+        "bank_name", "account_name", "iban", "swift_bic", "payment_due_date", "late_payment_penalties"
+    )
+})
+
+SPECIAL_CONDITIONS = nested_object({
+    "special_conditions": string_object(
+        "pro_rata_billing", "early_payment_discounts", "late_payment_penalties", "contract_references"
+    )
+})
+
+CUSTOMER_INFORMATION = nested_object({
+    "customer_information": nested_object({
+        "customer_name": {"type": "string"},
+        "customer_address": {"type": "string"},
+        "customer_contact": string_object("phone", "email"),
+        "vat_or_tax_id": {"type": "string"}
+    })
+})
+
+ADDITIONAL_INFORMATION = nested_object({
+    "additional_information": string_object("category_name", "details", "relevance")
+})
+
+# Schemas keyed by the name of their section in the process_contract result
+SECTION_SCHEMAS = {
+    "invoice_information": INVOICE_INFORMATION,
+    "service_details": SERVICE_DETAILS,
+    "calculation_details": CALCULATION_DETAILS,
+    "payment_instructions": PAYMENT_INSTRUCTIONS,
+    "special_conditions": SPECIAL_CONDITIONS,
+    "customer_information": CUSTOMER_INFORMATION,
+    "additional_information": ADDITIONAL_INFORMATION
+}
+
+
+def get_consolidated_schema():
+    """Schema for a single response holding the main analysis and all seven sections."""
+    fields = {"main_result": {"type": "string"}}
+    fields.update(SECTION_SCHEMAS)
+    return nested_object(fields)
+
+
+# Output budget of a section answer: tokens per string field (key, quotes and a typical value), items
+# expected in an array (e.g. invoice lines), and the braces and indentation of each object
+TOKENS_PER_FIELD = 64
+ARRAY_ITEMS = 12
+TOKENS_PER_OBJECT = 16
+
+
+def estimate_output_tokens(schema):
+    """Generous upper estimate of the tokens of a JSON instance of the schema, used to cap num_predict."""
+    if schema.get("type") == "object":
+        return TOKENS_PER_OBJECT + sum(estimate_output_tokens(field) for field in schema.get("properties", {}).values())
+    if schema.get("type") == "array":
+        return ARRAY_ITEMS * estimate_output_tokens(schema["items"])
+    return TOKENS_PER_FIELD
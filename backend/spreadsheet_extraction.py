@@ -0,0 +1,98 @@
+import os
+import openpyxl
+import xlrd
+
+# Maximum number of non-empty rows read from a workbook (all sheets together)
+SPREADSHEET_MAX_ROWS = 20000
+
+# Maximum number of non-empty cells read from a workbook (all sheets together)
+SPREADSHEET_MAX_CELLS = 500000
+
+
+def trim_row(cells):
+    """Drop trailing empty cells; returns an empty list for a fully empty row."""
+    end = len(cells)
+    while end and cells[end - 1] == '':
+        end -= 1
+    return cells[:end]
+
+
+def iter_xlsx_rows(source):
+    """Yield (sheet name, cells) for every non-empty row of an .xlsx path or file object, streaming in read-only mode."""
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            for row in worksheet.iter_rows(values_only=True):
+                cells = trim_row([str(cell) if cell is not None else '' for cell in row])
+                if cells:
+                    yield worksheet.title, cells
+    finally:
+        workbook.close()
+
+
+def iter_xls_rows(source):
+    """Yield (sheet name, cells) for every non-empty row of an .xls path or file object, loading one sheet at a time."""
+    if isinstance(source, (str, os.PathLike)):
+        workbook = xlrd.open_workbook(source, on_demand=True)
+    else:
+        # xlrd reads file objects only as bytes
+        workbook = xlrd.open_workbook(file_contents=source.read(), on_demand=True)
+    try:
+        for sheet_index in range(workbook.nsheets):
+            sheet = workbook.sheet_by_index(sheet_index)
+            for row_idx in range(sheet.nrows):
+                cells = trim_row([str(cell) for cell in sheet.row_values(row_idx)])
+                if cells:
+                    yield sheet.name, cells
+            workbook.unload_sheet(sheet_index)
+    finally:
+        workbook.release_resources()
+
+
+def iter_capped_rows(rows, max_rows=SPREADSHEET_MAX_ROWS, max_cells=SPREADSHEET_MAX_CELLS):
+    """Pass rows through until the row or cell cap is reached, then stop reading the workbook."""
+    row_count = 0
+    cell_count = 0
+    for sheet_name, cells in rows:
+        row_count += 1
+        cell_count += sum(1 for cell in cells if cell != '')
+        if row_count > max_rows or cell_count > max_cells:
+            print(f"Spreadsheet truncated after {row_count - 1} rows (limits: {max_rows} rows, {max_cells} cells)")
+            rows.close()
+            return
+        yield sheet_name, cells
+
+
+def format_sheet(rows):
+    """Tab-separated text for one sheet's rows, without the columns that are empty in every row."""
+    used = set()
+    for cells in rows:
+        used.update(column for column, cell in enumerate(cells) if cell != '')
+    used_columns = sorted(used)
+    return ''.join('\t'.join(cells[column] if column < len(cells) else '' for column in used_columns) + '\n' for cells in rows)
+
+
+def rows_to_text(rows):
+    # Rows are grouped per sheet so empty columns can be dropped; the caps bound how many are held at once
+    parts = []
+    sheet_rows = []
+    current_sheet = None
+    for sheet_name, cells in iter_capped_rows(rows):
+        if sheet_name != current_sheet and sheet_rows:
+            parts.append(format_sheet(sheet_rows))
+            sheet_rows = []
+        current_sheet = sheet_name
+        sheet_rows.append(cells)
+    if sheet_rows:
+        parts.append(format_sheet(sheet_rows))
+    return ''.join(parts)
+
+
+# Helper function to extract text from an Excel (.xlsx) file
+def extract_text_from_excel(source):
+    return rows_to_text(iter_xlsx_rows(source))
+
+
+# Helper function to extract text from an Excel (.xls) file
+def extract_text_from_xls(source):
+    return rows_to_text(iter_xls_rows(source))
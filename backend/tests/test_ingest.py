@@ -0,0 +1,39 @@
+import io
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import OLE2_MAGIC, sniff_format
+
+
+def compound_file(stream_name):
+    """Smallest OLE2 compound file: a FAT sector, then a directory sector with the root and one stream entry."""
+    header = bytearray(512)
+    header[:8] = OLE2_MAGIC
+    struct.pack_into('<HHH', header, 26, 3, 0xFFFE, 9)
+    struct.pack_into('<II', header, 44, 1, 1)
+    struct.pack_into('<109I', header, 76, 0, *[0xFFFFFFFF] * 108)
+
+    fat = bytearray(struct.pack('<128I', 0xFFFFFFFD, 0xFFFFFFFE, *[0xFFFFFFFF] * 126))
+
+    directory = bytearray(512)
+    for index, (name, entry_type) in enumerate([('Root Entry', 5), (stream_name, 2)]):
+        encoded = name.encode('utf-16-le') + b'\x00\x00'
+        directory[index * 128:index * 128 + len(encoded)] = encoded
+        struct.pack_into('<HB', directory, index * 128 + 64, len(encoded), entry_type)
+    return bytes(header + fat + directory)
+
+
+def test_ole2_with_a_workbook_stream_is_xls():
+    stream = io.BytesIO(compound_file('Workbook'))
+    assert sniff_format(stream) == '.xls'
+    assert stream.tell() == 0
+    assert sniff_format(io.BytesIO(compound_file('Book'))) == '.xls'
+
+
+def test_other_ole2_files_are_unsupported():
+    # A Word 97 document, and a compound file cut off before its directory
+    assert sniff_format(io.BytesIO(compound_file('WordDocument'))) is None
+    assert sniff_format(io.BytesIO(compound_file('Workbook')[:600])) is None
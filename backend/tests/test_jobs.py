@@ -0,0 +1,60 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jobs import DONE, RUNNING, JobQueue
+
+
+def wait_for_state(queue, job_id, state, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if queue.get(job_id)['state'] == state:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_high_priority_single_starts_while_a_batch_runs():
+    queue = JobQueue(workers=2, max_wait=300).start()
+    release = threading.Event()
+
+    def batch(progress):
+        release.wait(5)
+        return {}
+
+    batch_id = queue.submit(batch, priority='low', kind='batch', slots=2, units=100)
+    try:
+        assert wait_for_state(queue, batch_id, RUNNING)
+        # The batch is held to one slot, and a 100-file batch does not make the free slot look busy
+        assert queue.get(batch_id)['slots'] == 1
+        queue.check_admission('high')
+
+        single_id = queue.submit(lambda progress: {}, priority='high')
+        assert wait_for_state(queue, single_id, DONE)
+        assert queue.get(batch_id)['state'] == RUNNING
+    finally:
+        release.set()
+    assert wait_for_state(queue, batch_id, DONE)
+
+
+def test_second_batch_waits_while_singles_pass_it():
+    queue = JobQueue(workers=2, max_wait=3600).start()
+    release = threading.Event()
+
+    def batch(progress):
+        release.wait(5)
+        return {}
+
+    first = queue.submit(batch, priority='low', kind='batch', units=10)
+    second = queue.submit(batch, priority='low', kind='batch', units=10)
+    try:
+        assert wait_for_state(queue, first, RUNNING)
+        single_id = queue.submit(lambda progress: {}, priority='low')
+        assert wait_for_state(queue, single_id, DONE)
+        assert queue.get(second)['state'] == 'queued'
+    finally:
+        release.set()
+    assert wait_for_state(queue, second, DONE)
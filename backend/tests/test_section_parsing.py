@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_generator import render_invoice_from_text
+from section_parsing import parse_section
+from section_schemas import SECTION_SCHEMAS
+
+
+def test_list_of_objects_for_an_object_schema_keeps_the_first():
+    data, repaired = parse_section('invoice_information', '[{"invoice_number": "1"}, {"invoice_number": "2"}]')
+    assert repaired
+    assert isinstance(data, dict)
+    assert data['invoice_number'] == '1'
+
+
+def test_list_for_a_nested_object_keeps_the_first():
+    content = json.dumps({'invoice_number': '7', 'bill_to': [{'client_name': 'Alfa'}, {'client_name': 'Beta'}]})
+    data, repaired = parse_section('invoice_information', content)
+    assert repaired
+    assert data['bill_to']['client_name'] == 'Alfa'
+    assert isinstance(data['bill_to']['contact_information'], dict)
+
+
+def test_arrays_stay_lists():
+    content = json.dumps({'service_details': [{'description': 'Audit'}, {'description': 'Support'}]})
+    data, _ = parse_section('service_details', content)
+    assert [item['description'] for item in data['service_details']] == ['Audit', 'Support']
+
+
+def test_invoice_renders_when_sections_come_back_as_lists():
+    processed_data = {section: json.dumps({section: {}}) for section in SECTION_SCHEMAS}
+    processed_data['invoice_information'] = json.dumps([
+        {'invoice_number': '1', 'bill_to': [{'client_name': 'Alfa'}, {'client_name': 'Beta'}]},
+        {'invoice_number': '2'},
+    ])
+    processed_data['additional_information'] = json.dumps([{'category_name': 'A'}, {'category_name': 'B'}])
+    processed_data['main_result'] = 'Analysis'
+    assert render_invoice_from_text(processed_data).startswith(b'%PDF')
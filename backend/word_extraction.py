@@ -0,0 +1,10 @@
+import docx
+
+
+# Extract the text of a Word (.docx) path or file object, one paragraph per line
+def extract_text_from_word(source):
+    doc = docx.Document(source)
+    text = ''
+    for para in doc.paragraphs:
+        text += para.text + '\n'
+    return text
@@ -1,10 +1,23 @@
 import ollama
 import json
 import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 ml_model = 'llama3.1';
 
+# Maximum number of secondary prompts sent to the model at the same time (1 = sequential)
+secondary_concurrency = 4
+
+# Contracts processed at the same time in batch mode
+batch_workers = 2
+
+# Files picked up when the batch input is a directory
+batch_pattern = '*.txt'
+
 # Function to call the main prompt
 def set_main_prompt():
     return """
@@ -259,12 +272,34 @@ Think carefully.
     response = ollama.chat(model=ml_model, messages=[{'role': 'user', 'content': f"{prompt}\n{main_result}"}])
     return response['message']['content']
 
-# Main function to organize the flow and read contract data from a file
-def main(file_path):
-    # Read contract data from the provided file path
-    with open(file_path, 'r') as file:
-        contract_data = file.read()
-    
+# Secondary prompts keyed by the name of their section in the result dictionary
+def get_secondary_extractions():
+    return {
+        "invoice_information": extract_invoice_info,
+        "service_details": extract_service_details,
+        "calculation_details": extract_calculation_details,
+        "payment_instructions": extract_payment_instructions,
+        "special_conditions": extract_special_conditions,
+        "customer_information": extract_customer_info,
+        "additional_information": extract_additional_info
+    }
+
+# Run every secondary prompt on the main result, fanning out over a thread pool when concurrency > 1
+def run_secondary_extractions(main_result, concurrency=None):
+    global secondary_concurrency
+    if concurrency is None:
+        concurrency = secondary_concurrency
+    extractions = get_secondary_extractions()
+
+    if concurrency <= 1:
+        return {section: extract(main_result) for section, extract in extractions.items()}
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(extractions))) as executor:
+        futures = {section: executor.submit(extract, main_result) for section, extract in extractions.items()}
+        return {section: future.result() for section, future in futures.items()}
+
+# Run the main prompt and every secondary prompt on one contract
+def process_contract(contract_data, concurrency=None):
     # Set main prompt
     main_prompt = set_main_prompt()
     
@@ -272,42 +307,117 @@ def main(file_path):
     main_result = generate_ai_response(contract_data, main_prompt)
     
     # Step 2: Process main result through each secondary prompt
-    invoice_info = extract_invoice_info(main_result)
-    service_details = extract_service_details(main_result)
-    calculation_details = extract_calculation_details(main_result)
-    payment_instructions = extract_payment_instructions(main_result)
-    special_conditions = extract_special_conditions(main_result)
-    customer_info = extract_customer_info(main_result)
-    additional_info = extract_additional_info(main_result)
+    sections = run_secondary_extractions(main_result, concurrency)
     
     # Combine the results into a dictionary
-    result = {
-        "main_result": main_result,
-        "invoice_information": invoice_info,
-        "service_details": service_details,
-        "calculation_details": calculation_details,
-        "payment_instructions": payment_instructions,
-        "special_conditions": special_conditions,
-        "customer_information": customer_info,
-        "additional_information": additional_info
-    }
+    result = {"main_result": main_result}
+    result.update(sections)
+    return result
+
+# Main function to organize the flow and read contract data from a file
+def main(file_path, concurrency=None):
+    # Read contract data from the provided file path
+    with open(file_path, 'r') as file:
+        contract_data = file.read()
+    
+    result = process_contract(contract_data, concurrency)
     
     # Convert the result to a JSON string
     result_json = json.dumps(result, indent=4)
     
     return result_json
 
+# Contract files of a batch: every file matching batch_pattern in a directory, or the files matching a glob
+def find_batch_inputs(source, pattern=None):
+    global batch_pattern
+    if os.path.isdir(source):
+        source = os.path.join(source, pattern or batch_pattern)
+    return sorted(os.path.abspath(path) for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+
+# Inputs that already have a result in an earlier JSONL output; failed inputs are retried
+def read_completed_inputs(output_path):
+    completed = set()
+    if not output_path or not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run that was killed mid-write
+                continue
+            if isinstance(record, dict) and 'result' in record:
+                completed.add(record['path'])
+    return completed
+
+def process_file(file_path, concurrency=None):
+    with open(file_path, 'r') as file:
+        contract_data = file.read()
+    return process_contract(contract_data, concurrency)
+
+# Process a directory or glob of contracts, writing one JSON line per contract as soon as it is done
+def run_batch(source, output_path=None, workers=None, concurrency=None, pattern=None):
+    global batch_workers
+    if workers is None:
+        workers = batch_workers
+    inputs = find_batch_inputs(source, pattern)
+    completed = read_completed_inputs(output_path)
+    pending = [path for path in inputs if path not in completed]
+    print(f"{len(inputs)} contracts found, {len(inputs) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+
+    if output_path:
+        # Start on a fresh line if the previous run stopped in the middle of one
+        needs_newline = False
+        if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            with open(output_path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                needs_newline = existing.read(1) != b'\n'
+        output = open(output_path, 'a')
+        if needs_newline:
+            output.write('\n')
+    else:
+        output = sys.stdout
+
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(process_file, path, concurrency): path for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    record = {"path": path, "result": future.result()}
+                except Exception as e:
+                    failed += 1
+                    print(f"Failed to process {path}: {e}", file=sys.stderr)
+                    record = {"path": path, "error": str(e)}
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return failed
+
 # Entry point
 if __name__ == "__main__":
     # Setup argument parser
-    parser = argparse.ArgumentParser(description="Process contract data from a file.")
-    parser.add_argument('-path', type=str, required=True, help="Path to the contract text file")
+    parser = argparse.ArgumentParser(description="Process contract data from a file, or a batch of files into JSON lines.")
+    inputs = parser.add_mutually_exclusive_group(required=True)
+    inputs.add_argument('-path', type=str, help="Path to the contract text file")
+    inputs.add_argument('-batch', '--batch', type=str, help="Directory or glob of contract text files; prints one JSON line per contract")
+    parser.add_argument('-pattern', '--pattern', type=str, default=batch_pattern, help="Files to pick up when -batch is a directory")
+    parser.add_argument('-output', '--output', type=str, help="JSONL file for batch results; appended to, and inputs already in it are skipped")
+    parser.add_argument('-workers', '--workers', type=int, default=batch_workers, help="Number of contracts processed at the same time in batch mode")
+    parser.add_argument('-concurrency', type=int, default=secondary_concurrency, help="Number of secondary prompts to run at the same time (1 = sequential)")
     
     # Parse command line arguments
     args = parser.parse_args()
     
+    if args.batch:
+        failed = run_batch(args.batch, args.output, args.workers, args.concurrency, args.pattern)
+        sys.exit(1 if failed else 0)
+    
     # Call main function with the provided file path
-    result_json = main(args.path)
+    result_json = main(args.path, args.concurrency)
     
     # Print the resulting JSON string
-    print(result_json)
\ No newline at end of file
+    print(result_json)